@@ -0,0 +1,149 @@
+'''
+A local stand-in for D&D Beyond that serves the benchmark fixtures
+
+Usage:
+    python -m benchmarks.fakebeyond [--fixtures DIR] [--port PORT] [failure options]
+
+Point the bot or the batch command line at it with BEYOND_URL=http://127.0.0.1:PORT
+or --base-url, then every request can be delayed or made to fail:
+    latency drawn from a fixed, uniform or exponential distribution
+    500 errors, 429s with Retry-After, bodies cut off part way and slow drip responses
+Responses carry an ETag so conditional revalidation can be measured
+GET /_stats returns the counts of each kind of response sent
+'''
+
+import os
+import json
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import Counter
+
+from aiohttp import web
+
+from . import fixtures
+
+
+class FakeBeyond:
+    def __init__(self, directory=None, latency=0, distribution='fixed', error_rate=0, throttle_rate=0,
+                 retry_after=1, truncate_rate=0, drip_rate=0, drip_delay=0.1, seed=None):
+        self.directory = directory
+        self.latency = latency
+        self.distribution = distribution
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.truncate_rate = truncate_rate
+        self.drip_rate = drip_rate
+        self.drip_delay = drip_delay
+        self.random = random.Random(seed)
+        self.bodies = {}
+        self.stats = Counter()
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/api/config/json', self.config)
+        app.router.add_get('/character/{id:\\d+}/json', self.character)
+        app.router.add_get('/_stats', self.get_stats)
+        return app
+
+    def body(self, name, generate):
+        '''
+        Gets the encoded json for a fixture file, generating it if there is no file
+        '''
+        if name not in self.bodies:
+            path = None if self.directory is None else os.path.join(self.directory, name + '.json')
+            if path is not None and os.path.exists(path):
+                with open(path, 'rb') as f:
+                    body = f.read()
+            elif path is not None and name != 'config':
+                body = None
+            else:
+                body = json.dumps(generate()).encode()
+            self.bodies[name] = body
+        return self.bodies[name]
+
+    def delay(self):
+        if self.distribution == 'uniform':
+            return self.random.uniform(0, 2 * self.latency)
+        if self.distribution == 'exponential':
+            return self.random.expovariate(1 / self.latency) if self.latency else 0
+        return self.latency
+
+    async def config(self, request):
+        return await self.respond(request, self.body('config', fixtures.config))
+
+    async def character(self, request):
+        id = int(request.match_info['id'])
+        size = list(fixtures.SIZES)[(id - 1) % len(fixtures.SIZES)]
+        return await self.respond(request, self.body(str(id), lambda: fixtures.character(size, id)))
+
+    async def get_stats(self, request):
+        return web.json_response(self.stats)
+
+    async def respond(self, request, body):
+        await asyncio.sleep(self.delay())
+        roll = self.random.random()
+
+        if roll < self.error_rate:
+            self.stats['500'] += 1
+            return web.Response(status=500)
+        roll -= self.error_rate
+        if roll < self.throttle_rate:
+            self.stats['429'] += 1
+            return web.Response(status=429, headers={'Retry-After': str(self.retry_after)})
+        roll -= self.throttle_rate
+
+        if body is None:
+            self.stats['404'] += 1
+            return web.Response(status=404)
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        if request.headers.get('If-None-Match') == etag:
+            self.stats['304'] += 1
+            return web.Response(status=304, headers={'ETag': etag})
+
+        response = web.StreamResponse(headers={'ETag': etag, 'Content-Type': 'application/json'})
+        response.content_length = len(body)
+        await response.prepare(request)
+        if roll < self.truncate_rate:
+            # promise the whole body, send half and hang up
+            self.stats['truncated'] += 1
+            await response.write(body[:len(body) // 2])
+            request.transport.close()
+            return response
+        roll -= self.truncate_rate
+        if roll < self.drip_rate:
+            self.stats['drip'] += 1
+            chunk = max(len(body) // 20, 1)
+            for i in range(0, len(body), chunk):
+                await response.write(body[i:i + chunk])
+                await asyncio.sleep(self.drip_delay)
+        else:
+            self.stats['200'] += 1
+            await response.write(body)
+        await response.write_eof()
+        return response
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves benchmark fixtures as a fake D&D Beyond')
+    parser.add_argument('--fixtures', metavar='DIR', help='directory written by benchmarks.fixtures, '
+                        'characters are generated on demand if not given')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0, help='mean seconds before each response')
+    parser.add_argument('--distribution', choices=['fixed', 'uniform', 'exponential'], default='fixed')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of 500 responses')
+    parser.add_argument('--throttle-rate', type=float, default=0, help='fraction of 429 responses')
+    parser.add_argument('--retry-after', type=float, default=1, help='Retry-After seconds on 429s')
+    parser.add_argument('--truncate-rate', type=float, default=0, help='fraction of bodies cut off part way')
+    parser.add_argument('--drip-rate', type=float, default=0, help='fraction of bodies sent in slow chunks')
+    parser.add_argument('--drip-delay', type=float, default=0.1, help='seconds between drip chunks')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    server = FakeBeyond(
+        args.fixtures, args.latency, args.distribution, args.error_rate, args.throttle_rate,
+        args.retry_after, args.truncate_rate, args.drip_rate, args.drip_delay, args.seed)
+    web.run_app(server.app(), host=args.host, port=args.port)
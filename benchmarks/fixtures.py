@@ -0,0 +1,293 @@
+'''
+Synthetic D&D Beyond config and character json for offline benchmarks
+
+The payloads only contain the fields that beyondapi reads, plus the long
+descriptions that make real spellcaster sheets large
+Generation is seeded so every run produces identical sheets
+'''
+
+import os
+import json
+import random
+
+STATS = ['Strength', 'Dexterity', 'Constitution', 'Intelligence', 'Wisdom', 'Charisma']
+SKILLS = [
+    ('Acrobatics', 2), ('Animal Handling', 5), ('Arcana', 4), ('Athletics', 1),
+    ('Deception', 6), ('History', 4), ('Insight', 5), ('Intimidation', 6),
+    ('Investigation', 4), ('Medicine', 5), ('Nature', 4), ('Perception', 5),
+    ('Performance', 6), ('Persuasion', 6), ('Religion', 4), ('Sleight of Hand', 2),
+    ('Stealth', 2), ('Survival', 5),
+]
+ADJUSTMENT_TYPES = [
+    'Skill Magic Bonus', 'Skill Misc Bonus', 'Skill Override', 'Skill Proficiency Level',
+    'Skill Stat Override', 'Saving Throw Magic Bonus', 'Saving Throw Misc Bonus',
+    'Saving Throw Override', 'Saving Throw Proficiency Level', 'Fixed Value Bonus',
+    'Fixed Value Override', 'Is Hexblade', 'Is Pact Weapon', 'Name Override', 'To Hit Bonus',
+    'To Hit Override', 'Dual Wield', 'Display As Attack',
+]
+DAMAGE_TYPES = ['Bludgeoning', 'Piercing', 'Slashing', 'Fire', 'Cold', 'Lightning', 'Radiant', 'Necrotic']
+PROPERTIES = ['Finesse', 'Light', 'Two-Handed', 'Versatile', 'Thrown', 'Heavy', 'Reach']
+WEAPONS = [
+    # name, category, die, damage type, properties
+    ('Dagger', 1, 4, 'Piercing', ['Finesse', 'Light', 'Thrown']),
+    ('Quarterstaff', 1, 6, 'Bludgeoning', ['Versatile']),
+    ('Shortbow', 1, 6, 'Piercing', ['Two-Handed']),
+    ('Longsword', 2, 8, 'Slashing', ['Versatile']),
+    ('Rapier', 2, 8, 'Piercing', ['Finesse']),
+    ('Greatsword', 2, 6, 'Slashing', ['Heavy', 'Two-Handed']),
+    ('Longbow', 2, 8, 'Piercing', ['Heavy', 'Two-Handed']),
+]
+CLASSES = [
+    # name, hit die, spellcasting stat
+    ('Fighter', 10, None),
+    ('Wizard', 6, 4),
+    ('Cleric', 8, 5),
+    ('Warlock', 8, 6),
+    ('Rogue', 8, None),
+    ('Sorcerer', 6, 6),
+]
+
+SIZES = {
+    # classes and levels, inventory items, spells per class, custom actions
+    'small': ([('Fighter', 3)], 8, 0, 0),
+    'medium': ([('Cleric', 6), ('Fighter', 2)], 40, 12, 2),
+    'large': ([('Wizard', 9), ('Cleric', 6), ('Warlock', 5)], 400, 60, 10),
+}
+
+
+def description(rng, words):
+    '''
+    HTML filler the size of a real spell or item description
+    '''
+    text = ' '.join(rng.choice(['arcane', 'the', 'creature', 'within', 'range', 'damage', 'must', 'succeed'])
+                    for _ in range(words))
+    return '<p>{}</p>'.format(text)
+
+
+def config():
+    return {
+        'stats': [{'id': i + 1, 'name': name} for i, name in enumerate(STATS)],
+        'abilitySkills': [{'id': i + 1, 'name': name, 'stat': stat} for i, (name, stat) in enumerate(SKILLS)],
+        'adjustmentTypes': [{'id': i + 1, 'name': name} for i, name in enumerate(ADJUSTMENT_TYPES)],
+        'damageTypes': [{'id': i + 1, 'name': name} for i, name in enumerate(DAMAGE_TYPES)],
+        'weaponProperties': [{'id': i + 1, 'name': name} for i, name in enumerate(PROPERTIES)],
+        'weaponCategories': [{'id': 1, 'name': 'Simple'}, {'id': 2, 'name': 'Martial'}],
+        'weapons': [{'name': name, 'categoryId': category} for name, category, *_ in WEAPONS],
+    }
+
+
+def modifier(type, subType, value=None, statId=None):
+    return {
+        'type': type,
+        'subType': subType,
+        'value': value,
+        'statId': statId,
+        'isGranted': True,
+        'friendlySubtypeName': subType.replace('-', ' ').title(),
+    }
+
+
+def weapon(rng, id, equipped):
+    name, category, die, damageType, properties = rng.choice(WEAPONS)
+    return {
+        'id': id,
+        'equipped': equipped,
+        'definition': {
+            'name': name,
+            'type': name,
+            'filterType': 'Weapon',
+            'attackType': 2 if 'bow' in name else 1,
+            'isMonkWeapon': False,
+            'magic': rng.random() < 0.3,
+            'damage': {'diceCount': 1, 'diceValue': die},
+            'damageType': damageType,
+            'grantedModifiers': [modifier('bonus', 'magic', rng.randint(1, 3))] if rng.random() < 0.3 else [],
+            'properties': [{'name': p, 'notes': '1d10' if p == 'Versatile' else None} for p in properties],
+            'description': description(rng, 80),
+        },
+    }
+
+
+def gear(rng, id):
+    return {
+        'id': id,
+        'equipped': False,
+        'definition': {
+            'name': 'Trinket {}'.format(id),
+            'type': 'Gear',
+            'filterType': 'Other Gear',
+            'description': description(rng, 120),
+            'grantedModifiers': [],
+        },
+    }
+
+
+def spell(rng, id, stat):
+    attack = rng.random() < 0.5
+    level = rng.randint(0, 9)
+    return {
+        'id': id,
+        'displayAsAttack': rng.random() < 0.3,
+        'spellCastingAbilityId': stat,
+        'definition': {
+            'name': 'Spell {}'.format(id),
+            'level': level,
+            'requiresAttackRoll': attack,
+            'requiresSavingThrow': not attack,
+            'saveDcAbilityId': rng.randint(1, 6),
+            'modifiers': [{
+                'type': 'damage',
+                'subType': rng.choice(DAMAGE_TYPES).lower(),
+                'usePrimaryStat': rng.random() < 0.2,
+                'die': {'diceString': '{}d{}'.format(rng.randint(1, 8), rng.choice([4, 6, 8, 10])), 'fixedValue': None},
+                'atHigherLevels': {
+                    'scaleType': 'characterlevel',
+                    'points': [
+                        {'level': lvl, 'die': {'diceString': '{}d10'.format(n), 'fixedValue': None}}
+                        for n, lvl in enumerate([5, 11, 17], 2)
+                    ],
+                } if level == 0 else None,
+            }],
+            'description': description(rng, 250),
+            'higherLevelDescription': description(rng, 40),
+        },
+    }
+
+
+def character(size='small', id=1):
+    '''
+    Builds a character sheet of the given size: small, medium or large
+    '''
+    rng = random.Random('{}-{}'.format(size, id))
+    classes, items, spells, custom = SIZES[size]
+
+    json = {
+        'id': id,
+        'name': '{} character {}'.format(size.title(), id),
+        'readonlyUrl': 'https://www.dndbeyond.com/profile/bench/characters/{}'.format(id),
+        'avatarUrl': 'https://www.dndbeyond.com/avatars/{}.png'.format(id),
+        'themeColor': {'themeColor': '#{:06X}'.format(rng.randrange(0x1000000))},
+        'stats': [{'id': i + 1, 'value': rng.randint(8, 16)} for i in range(6)],
+        'bonusStats': [{'id': i + 1, 'value': None} for i in range(6)],
+        'overrideStats': [{'id': i + 1, 'value': None} for i in range(6)],
+        'notes': {'otherNotes': 'Backstory ' + description(rng, 200) + '\nsneak: 3d6\nsmite: 2d8+1d8'},
+        'options': {'class': [{'definition': {'name': 'Dueling'}}]},
+        'customProficiencies': [],
+        'characterValues': [],
+        'classes': [],
+        'classSpells': [],
+        'spells': {'race': [], 'class': [], 'item': []},
+        'actions': {'race': [], 'class': [], 'feat': []},
+        'customActions': [],
+        'inventory': [],
+        'modifiers': {'race': [], 'class': [], 'background': [], 'item': [], 'feat': []},
+    }
+
+    # modifiers
+    mods = json['modifiers']
+    mods['race'].append(modifier('bonus', rng.choice(STATS).lower() + '-score', 2))
+    mods['race'].append(modifier('bonus', rng.choice(STATS).lower() + '-score', 1))
+    mods['background'].extend(modifier('proficiency', rng.choice(SKILLS)[0].lower().replace(' ', '-'))
+                              for _ in range(4))
+    mods['class'].append(modifier('proficiency', 'simple-weapons'))
+    mods['class'].append(modifier('proficiency', 'martial-weapons'))
+    mods['class'].extend(modifier('proficiency', s.lower() + '-saving-throws') for s in rng.sample(STATS, 2))
+    mods['class'].append(modifier('expertise', rng.choice(SKILLS)[0].lower().replace(' ', '-')))
+
+    # classes
+    for i, (name, level) in enumerate(classes):
+        _, _, stat = next(c for c in CLASSES if c[0] == name)
+        id = 100 + i
+        json['classes'].append({
+            'id': id,
+            'level': level,
+            'definition': {'name': name, 'spellCastingAbilityId': stat},
+            'subclassDefinition': {'name': 'School of Benchmarks'} if level >= 3 else None,
+            'classFeatures': [{'definition': {'name': 'Feature {}'.format(n), 'description': description(rng, 60)}}
+                              for n in range(level * 2)],
+        })
+        # every level grants class modifiers on a real sheet
+        mods['class'].extend(modifier('bonus', 'class-feature-{}'.format(n), 1) for n in range(level * 3))
+        if stat is not None and spells:
+            json['classSpells'].append({
+                'characterClassId': id,
+                'spells': [spell(rng, id * 1000 + n, stat) for n in range(spells)],
+            })
+
+    # inventory
+    equipped = 0
+    for n in range(items):
+        if n % 4 == 0:
+            item = weapon(rng, n + 1, equipped < 3)
+            equipped += item['equipped']
+        else:
+            item = gear(rng, n + 1)
+        if rng.random() < 0.1:
+            mods['item'].append(modifier('bonus', rng.choice(['armor-class', 'saving-throws', 'ability-checks']), 1))
+        json['inventory'].append(item)
+    json['inventory'].append({
+        'id': items + 1,
+        'equipped': True,
+        'definition': {
+            'name': 'Chain Shirt',
+            'type': 'Medium Armor',
+            'filterType': 'Armor',
+            'armorClass': 13,
+            'description': description(rng, 60),
+            'grantedModifiers': [],
+        },
+    })
+
+    # actions
+    json['actions']['race'].append({
+        'name': 'Unarmed Strike',
+        'displayAsAttack': True,
+        'attackSubtype': 3,
+        'isMartialArts': False,
+        'isProficient': True,
+        'damageTypeId': 1,
+    })
+    for n in range(custom):
+        json['customActions'].append({
+            'name': 'Custom {}'.format(n),
+            'fixedValue': None,
+            'damageBonus': rng.randint(0, 2),
+            'statId': rng.randint(1, 6),
+            'rangeId': rng.choice([1, 2]),
+            'toHitBonus': None,
+            'isProficient': True,
+            'actionType': 1,
+            'saveStatId': None,
+            'fixedSaveDc': None,
+            'diceCount': rng.randint(1, 3),
+            'diceType': rng.choice([6, 8, 10]),
+            'damageTypeId': rng.randint(1, len(DAMAGE_TYPES)),
+        })
+
+    return json
+
+
+def write(directory, count=1):
+    '''
+    Writes config.json and count characters of each size as <id>.json
+    '''
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'config.json'), 'w') as f:
+        json.dump(config(), f)
+    id = 0
+    for _ in range(count):
+        for size in SIZES:
+            id += 1
+            with open(os.path.join(directory, '{}.json'.format(id)), 'w') as f:
+                json.dump(character(size, id), f)
+    return id
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Writes the benchmark fixtures as json files')
+    parser.add_argument('directory')
+    parser.add_argument('-n', '--count', type=int, default=1, help='characters of each size')
+    args = parser.parse_args()
+    print('wrote', write(args.directory, args.count), 'characters')
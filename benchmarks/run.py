@@ -0,0 +1,94 @@
+'''
+Times the derived character data in beyondapi against offline fixtures
+
+Usage:
+    python -m benchmarks.run [--save FILE] [--compare FILE] [--tolerance FRACTION] [--only NAME]
+
+Each case reports calls per second and the peak memory allocated by one call
+--save writes the results as json, --compare reports the change from a saved run
+and exits with status 1 if any case got slower by more than the tolerance
+'''
+
+import sys
+import json
+import timeit
+import argparse
+import tracemalloc
+
+from cogs import beyondapi as api
+from . import fixtures
+
+PROPERTIES = ['stats', 'skills', 'ac', 'attacks']
+
+
+def cases():
+    '''
+    Yields (name, function) for every benchmark
+    '''
+    config = api.Config(fixtures.config())
+    for id, size in enumerate(fixtures.SIZES, 1):
+        sheet = fixtures.character(size, id)
+        text = json.dumps(sheet)
+        yield f'{size}/parse', lambda text=text: json.loads(text)
+
+        data = api.loads_character(text)
+        yield f'{size}/construct', lambda data=data: api.Character(id, data, config)
+        # a fresh character each call, properties are cached on the instance
+        for name in PROPERTIES:
+            yield f'{size}/{name}', lambda data=data, name=name: getattr(api.Character(id, data, config), name)
+        yield f'{size}/snapshot', lambda data=data: api.Character(id, data, config).snapshot()
+
+
+def measure(func):
+    '''
+    Returns (calls per second, peak bytes allocated by one call)
+    '''
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=5, number=number)) / number
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return 1 / best, peak
+
+
+def main(args):
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    print(f"{'case':<32}{'ops/sec':>12}{'peak KiB':>12}{'change':>10}")
+    for name, func in cases():
+        if args.only and args.only not in name:
+            continue
+        ops, peak = measure(func)
+        results[name] = {'ops': ops, 'peak': peak}
+        change = ''
+        if name in baseline:
+            ratio = ops / baseline[name]['ops'] - 1
+            change = f'{ratio:+.0%}'
+            if ratio < -args.tolerance:
+                regressions.append(name)
+                change += ' !'
+        print(f'{name:<32}{ops:>12,.0f}{peak / 1024:>12,.1f}{change:>10}')
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if regressions:
+        print('slower than baseline:', ', '.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks beyondapi character derivation offline')
+    parser.add_argument('--save', metavar='FILE', help='write the results to FILE')
+    parser.add_argument('--compare', metavar='FILE', help='compare against results saved in FILE')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before failing')
+    parser.add_argument('--only', metavar='NAME', help='only run cases containing NAME')
+    sys.exit(main(parser.parse_args()))
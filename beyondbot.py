@@ -18,26 +18,67 @@ from contextlib import closing
 
 import discord
 from discord.ext import commands
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import IntegrityError
 from equations import EquationError
 
 from cogs import model as m
-from cogs.util import delete_emoji
+from cogs import beyondapi as api
+from cogs.database import Database, connect
+from cogs.util import delete_emoji, SnapshotStore
 
 
 default_prefix = '/'
 
+# copies of the prefixes and blacklist tables, loaded in main
+# every change goes through the commands below, which update both
+prefixes = {}  # server id: prefix
+blacklist = set()  # user ids
+
+
+def load_prefixes_and_blacklist(session):
+    prefixes.clear()
+    prefixes.update(session.query(m.Prefix.server, m.Prefix.prefix))
+    blacklist.clear()
+    blacklist.update(id for id, in session.query(m.Blacklist.id))
+
+
+def save_prefix(session, server, prefix):
+    item = session.query(m.Prefix).get(server)
+    if prefix == default_prefix:
+        if item is not None:
+            session.delete(item)
+    else:
+        if item is None:
+            item = m.Prefix(server=server)
+            session.add(item)
+        item.prefix = prefix
+    try:
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        raise Exception('Could not change prefix, an unknown error occured')
+
+
+def set_blacklisted(session, user, blacklisted):
+    item = session.query(m.Blacklist).get(user)
+    if blacklisted and item is None:
+        session.add(m.Blacklist(id=user))
+    elif not blacklisted and item is not None:
+        session.delete(item)
+    else:
+        return
+    try:
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        raise Exception('Could not change the blacklist, an unknown error occured')
+
 
 async def get_prefix(bot: commands.Bot, message: discord.Message):
     if message.guild:
-        with closing(bot.Session()) as session:
-            item = session.query(m.Prefix).get(message.guild.id)
-            prefix = default_prefix if item is None else item.prefix
-    else:
-        prefix = default_prefix
-    return prefix
+        return prefixes.get(message.guild.id, default_prefix)
+    return default_prefix
 
 bot = commands.Bot(
     command_prefix=get_prefix,
@@ -59,29 +100,10 @@ async def on_ready():
     await bot.change_presence(activity=game)
 
 
-@bot.before_invoke
-async def before_any_command(ctx):
-    '''
-    Set up database connection
-    '''
-    ctx.session = bot.Session()
-
-
-@bot.after_invoke
-async def after_any_command(ctx):
-    '''
-    Tear down database connection
-    '''
-    ctx.session.close()
-    ctx.session = None
-
-
 @bot.event
 async def on_message(message):
     ctx = await bot.get_context(message)
-    with closing(bot.Session()) as session:
-        blacklisted = session.query(m.Blacklist).get(ctx.author.id)
-    if blacklisted:
+    if ctx.author.id in blacklist:
         await on_command_error(ctx, Exception('User does not have permission for this command'))
     elif ctx.valid:
         await bot.invoke(ctx)
@@ -99,6 +121,19 @@ async def on_message(message):
             await bot.process_commands(m2)
 
 
+async def refresh_config():
+    '''
+    Reloads the D&D Beyond config in the background every CONFIG_TTL seconds
+    '''
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        await asyncio.sleep(api.CONFIG_TTL)
+        try:
+            await api.reload_config()
+        except Exception as e:
+            print('Could not refresh config:', e)
+
+
 def is_my_delete_emoji(reaction):
     return reaction.me and reaction.count > 1 and str(reaction.emoji) == delete_emoji
 
@@ -140,6 +175,8 @@ async def on_command_error(ctx, error: Exception):
             message = 'Invalid dice expression: {}'.format(error.args[0])
         else:
             message = 'Invalid dice expression'
+    elif isinstance(error, api.BeyondError):
+        message = 'Error: {}'.format(error)
     elif isinstance(error, ValueError):
         if error.args:
             message = 'Invalid parameter: {}'.format(error.args[0])
@@ -176,23 +213,13 @@ async def setprefix(ctx, prefix: str = default_prefix):
         leave blank to reset
     '''
     guild_id = ctx.guild.id
-    item = ctx.session.query(m.Prefix).get(guild_id)
+    await bot.db.run('setprefix', save_prefix, guild_id, prefix)
     if prefix == default_prefix:
-        if item is not None:
-            ctx.session.delete(item)
-    else:
-        if item is None:
-            item = m.Prefix(server=guild_id)
-            ctx.session.add(item)
-        item.prefix = prefix
-    try:
-        ctx.session.commit()
-    except IntegrityError:
-        ctx.session.rollback()
-        raise Exception('Could not change prefix, an unknown error occured')
+        prefixes.pop(guild_id, None)
     else:
-        embed = discord.Embed(description='Prefix changed to `{}`'.format(prefix), color=ctx.author.color)
-        await ctx.send(embed=embed)
+        prefixes[guild_id] = prefix
+    embed = discord.Embed(description='Prefix changed to `{}`'.format(prefix), color=ctx.author.color)
+    await ctx.send(embed=embed)
 
 
 @bot.command(ignore_extra=False)
@@ -200,12 +227,7 @@ async def checkprefix(ctx):
     '''
     Echoes the prefix the bot is currently set to respond to in this server
     '''
-    if ctx.guild:
-        with closing(bot.Session()) as session:
-            item = session.query(m.Prefix).get(ctx.guild.id)
-            prefix = default_prefix if item is None else item.prefix
-    else:
-        prefix = default_prefix
+    prefix = await get_prefix(bot, ctx.message)
 
     message = 'Current prefix = `{}`'.format(prefix)
     message += '\n(click {} below to delete this message)'.format(delete_emoji)
@@ -214,6 +236,69 @@ async def checkprefix(ctx):
     await msg.add_reaction(delete_emoji)
 
 
+@bot.command('blacklist', ignore_extra=False)
+@commands.is_owner()
+async def blacklist_user(ctx, user: discord.User):
+    '''
+    Stops a user from using the bot
+    Can only be done by the bot owner
+
+    Parameters:
+    [user] the user to blacklist
+    '''
+    await bot.db.run('blacklist', set_blacklisted, user.id, True)
+    blacklist.add(user.id)
+    embed = discord.Embed(description='{} can no longer use the bot'.format(user.mention), color=ctx.author.color)
+    await ctx.send(embed=embed)
+
+
+@bot.command('unblacklist', ignore_extra=False)
+@commands.is_owner()
+async def unblacklist_user(ctx, user: discord.User):
+    '''
+    Lets a blacklisted user use the bot again
+    Can only be done by the bot owner
+
+    Parameters:
+    [user] the user to remove from the blacklist
+    '''
+    await bot.db.run('blacklist', set_blacklisted, user.id, False)
+    blacklist.discard(user.id)
+    embed = discord.Embed(description='{} can use the bot again'.format(user.mention), color=ctx.author.color)
+    await ctx.send(embed=embed)
+
+
+@bot.command(ignore_extra=False)
+@commands.is_owner()
+async def reloadconfig(ctx):
+    '''
+    Reloads the game data shared by every character from D&D Beyond
+    Can only be done by the bot owner
+    '''
+    await api.reload_config()
+    counts = '\n'.join('{}: {}'.format(k, v) for k, v in sorted(api.metrics.items()))
+    message = 'Config reloaded\n```\n{}\n```'.format(counts)
+    message += '\n(click {} below to delete this message)'.format(delete_emoji)
+    embed = discord.Embed(description=message, color=ctx.author.color)
+    msg = await ctx.send(embed=embed)
+    await msg.add_reaction(delete_emoji)
+
+
+@bot.command(ignore_extra=False)
+@commands.is_owner()
+async def dbstats(ctx):
+    '''
+    Shows how long database calls waited for a thread and took to run
+    Can only be done by the bot owner
+    '''
+    report = bot.db.report() or 'No database calls yet'
+    message = '```\n{}\n```'.format(report)
+    message += '\n(click {} below to delete this message)'.format(delete_emoji)
+    embed = discord.Embed(description=message, color=ctx.author.color)
+    msg = await ctx.send(embed=embed)
+    await msg.add_reaction(delete_emoji)
+
+
 prefix = 'cogs.'
 for extension in [
     'characters',
@@ -221,6 +306,7 @@ for extension in [
     'attacks',
     'skills',
     'custom_rolls',
+    'prefetch',
 ]:
     bot.load_extension(prefix + extension)
 
@@ -231,11 +317,16 @@ for extension in [
 def main(database: str):
     bot.config = OrderedDict([
         ('token', None),
+        ('character_cache_bytes', str(api.CACHE_BYTES)),
+        ('character_cache_ttl', str(api.CACHE_TTL)),
     ])
 
-    engine = create_engine(database)
+    engine = connect(database)
     m.Base.metadata.create_all(engine)
     bot.Session = sessionmaker(bind=engine)
+    bot.db = Database(bot.Session)
+    api.snapshot_store = SnapshotStore(bot.db)
+    bot.loop.run_until_complete(bot.db.run('startup', load_prefixes_and_blacklist))
     with closing(bot.Session()) as session:
         for name in bot.config:
             key = session.query(m.Config).get(name)
@@ -246,6 +337,11 @@ def main(database: str):
                 session.add(key)
                 session.commit()
 
+    api.character_cache.max_bytes = int(bot.config['character_cache_bytes'])
+    api.character_cache.ttl = float(bot.config['character_cache_ttl'])
+    bot.loop.run_until_complete(api.reload_config())
+    bot.loop.create_task(refresh_config())
+
     bot.run(bot.config['token'])
 
 
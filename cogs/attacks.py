@@ -1,24 +1,54 @@
+import re
+
+import numpy
 import discord
 from discord.ext import commands
 
 from . import util
 from . import rolls
 
+SIM_ROUNDS = 10000  # rounds simulated when not given
+MAX_SIM_ROUNDS = 100000
+SIM_PERCENTILES = (5, 25, 50, 75, 95)
+
+# [adv|dis] <name|all> vs [AC] <armor class> [rounds]
+SIM = re.compile(r'(?:(adv|advantage|dis|disadv|disadvantage)\s+)?(.+?)\s+vs\.?\s+(?:ac\s*)?(-?\d+)(?:\s+(\d+))?',
+                 re.IGNORECASE | re.DOTALL)
+
+
+def simulate(attacks, ac, rounds, advantage=0):
+    '''
+    Simulates rounds of making every attack once against an armor class
+    A natural 20 always hits and rolls the damage dice twice, a natural 1 always misses
+    Returns ([(name, hit rate, crit rate, mean damage)], array of the damage dealt each round)
+    '''
+    d20 = rolls.compile_roll('1d20')
+    total = numpy.zeros(rounds, dtype=numpy.float64)
+    results = []
+    for attack in attacks:
+        natural = d20.sample(rounds, advantage)
+        crit = natural == 20
+        hit = crit | ((natural != 1) & (natural + attack['attackBonus'] >= ac))
+        if attack['damage'] is not None:
+            damage = rolls.compile_roll(str(attack['damage'])).sample(rounds, crit=crit)
+            damage = numpy.where(hit, numpy.maximum(damage, 0), 0)
+        else:
+            damage = numpy.zeros(rounds)
+        total += damage
+        results.append((attack['name'], hit.mean(), crit.mean(), damage.mean()))
+    return results, total
+
 
 class AttackCategory (util.Cog):
     @commands.group('attack', aliases=['a'], invoke_without_command=True)
     async def group(self, ctx, *, name: str):
-        name = util.strip_quotes(name)
+        name, count, keep = rolls.parse_repeat(util.strip_quotes(name))
 
         if not hasattr(ctx, 'advantage'):
             ctx.advantage = 0
 
-        character = util.get_character(ctx, ctx.author.id)
-        attack = None
-        for a in character.attacks:
-            if a['name'].lower() == name.lower():
-                attack = a
-                break
+        character = await util.get_character(ctx, ctx.author.id)
+        attack = character.attacks_by_name.get(name.lower())
         if attack is None:
             raise ValueError('No attack with that name')
 
@@ -29,17 +59,36 @@ class AttackCategory (util.Cog):
             name += ' with disadvantage'
         embed = discord.Embed(title=name, color=character.color())
         embed.set_author(**character.embed_author())
+        # repeated attacks keep the best or worst attack rolls and their damage
+        keep_indices = None
         if attack['attackBonus'] is not None:
             if isinstance(attack['attackBonus'], (int, float)):
-                text = []
-                result = rolls.do_roll(f"1d20+{attack['attackBonus']}", advantage=ctx.advantage, output=text)
-                embed.add_field(name='attack roll', value='\n'.join(text), inline=True)
+                expression = f"1d20+{attack['attackBonus']}"
+                if count == 1:
+                    text = rolls.Transcript()
+                    result = await rolls.do_roll_async(
+                        expression, advantage=ctx.advantage, output=text, loop=ctx.bot.loop)
+                    embed.add_field(name='attack roll', value=text.render(rolls.FIELD_LIMIT), inline=True)
+                else:
+                    hits = await rolls.repeat_roll_async(expression, count, ctx.advantage, loop=ctx.bot.loop)
+                    keep_indices = rolls.kept(hits, keep)
+                    value = rolls.format_results(hits, keep_indices)
+                    embed.add_field(name=f'attack rolls × {count}', value=value, inline=True)
             else:
                 embed.add_field(name='attack roll', value=attack['attackBonus'])
         if attack['damage'] is not None:
-            text = []
-            result = rolls.do_roll(attack['damage'], output=text)
-            embed.add_field(name='damage roll', value='\n'.join(text), inline=True)
+            damage_expression = str(attack['damage'])
+            if count == 1:
+                text = rolls.Transcript()
+                result = await rolls.do_roll_async(damage_expression, output=text, loop=ctx.bot.loop)
+                embed.add_field(name='damage roll', value=text.render(rolls.FIELD_LIMIT), inline=True)
+            else:
+                damage = await rolls.repeat_roll_async(damage_expression, count, loop=ctx.bot.loop)
+                if keep_indices is None:
+                    keep_indices = rolls.kept(damage, keep)
+                result = sum(damage[i] for i in keep_indices)
+                value = rolls.format_results(damage, keep_indices)
+                embed.add_field(name=f'damage rolls × {count}', value=value, inline=True)
             if attack['damageType'] is None:
                 embed.set_footer(text=f'{result} damage')
             else:
@@ -56,9 +105,66 @@ class AttackCategory (util.Cog):
         ctx.advantage = -1
         await ctx.invoke(self.group, name=name)
 
+    @group.command()
+    async def sim(self, ctx, *, args: str):
+        '''
+        Simulates many rounds of attacking and reports the damage dealt
+
+        Parameters:
+        [args*] [adv|dis] <attack name or all> vs AC <armor class> [rounds]
+            rounds defaults to 10000, at most 100000
+        '''
+        match = SIM.fullmatch(util.strip_quotes(args).strip())
+        if match is None:
+            raise commands.BadArgument('Use: [adv|dis] <attack name or all> vs AC <armor class> [rounds]')
+        advantage, name, ac, rounds = match.groups()
+        advantage = 0 if advantage is None else 1 if advantage.lower().startswith('adv') else -1
+        ac = int(ac)
+        rounds = SIM_ROUNDS if rounds is None else int(rounds)
+        if not 1 <= rounds <= MAX_SIM_ROUNDS:
+            raise ValueError('Can simulate 1 to {:,} rounds'.format(MAX_SIM_ROUNDS))
+
+        character = await util.get_character(ctx, ctx.author.id)
+        if name.lower() == 'all':
+            attacks = character.attacks
+        else:
+            attack = character.attacks_by_name.get(name.lower())
+            if attack is None:
+                raise ValueError('No attack with that name')
+            attacks = [attack]
+        # saves and other attacks without a numeric bonus have nothing to roll against AC
+        skipped = [a['name'] for a in attacks if not isinstance(a['attackBonus'], (int, float))]
+        attacks = [a for a in attacks if isinstance(a['attackBonus'], (int, float))]
+        if not attacks:
+            raise ValueError('No attack rolls to simulate')
+
+        results, damage = await ctx.bot.loop.run_in_executor(
+            rolls.worker, simulate, attacks, ac, rounds, advantage)
+
+        lines = []
+        for attack, hit, crit, mean in results:
+            lines.append(f'**{attack}:** hits {hit:.1%}, crits {crit:.1%}, {mean:.2f} damage')
+        if skipped:
+            lines.append('Not simulated: ' + ', '.join(skipped))
+        lines.append('')
+        lines.append(f'Damage per round: {damage.mean():.2f} on average')
+        lines.append('Percentiles: ' + ', '.join(
+            f'{p}%: {numpy.percentile(damage, p):g}' for p in SIM_PERCENTILES))
+
+        title = f"{'All attacks' if name.lower() == 'all' else attacks[0]['name']} vs AC {ac}"
+        if advantage > 0:
+            title += ' with advantage'
+        elif advantage < 0:
+            title += ' with disadvantage'
+        embed = discord.Embed(title=title, description='\n'.join(lines)[:rolls.DESCRIPTION_LIMIT],
+                              color=character.color())
+        embed.set_author(**character.embed_author())
+        embed.set_footer(text=f'{rounds:,} rounds simulated')
+        await ctx.send(embed=embed)
+
     @group.command(ignore_extra=False)
     async def list(self, ctx):
-        character = util.get_character(ctx, ctx.author.id)
+        character = await util.get_character(ctx, ctx.author.id)
         attacks = []
         for attack in character.attacks:
             if isinstance(attack['attackBonus'], (int, float)):
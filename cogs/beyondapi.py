@@ -1,63 +1,688 @@
 from math import ceil
-from collections import OrderedDict, defaultdict
-from itertools import chain
+from copy import copy
+from collections import OrderedDict, Counter, defaultdict
+from itertools import chain, count
+from types import MappingProxyType
+from email.utils import parsedate_to_datetime
+import os
+import sys
 import re
-from pprint import pprint
-
-import requests
-
-URL_BASE = "https://www.dndbeyond.com"
+import time
+import json
+import zlib
+import hashlib
+import heapq
+import random
+import asyncio
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+
+import aiohttp
+
+URL_BASE = os.environ.get('BEYOND_URL', "https://www.dndbeyond.com")
 CHARACTER_URL = URL_BASE + "/character/{id}/json"
 CONFIG_URL = URL_BASE + "/api/config/json"
+CONFIG_TTL = 60 * 60  # seconds between background config refreshes
+CACHE_BYTES = 64 * 1024 * 1024  # memory bound for cached character snapshots
+CACHE_TTL = 60  # seconds a cached character is used without revalidating
+POOL_SIZE = 20  # concurrent connections to D&D Beyond
+CONNECT_TIMEOUT = 5  # seconds
+READ_TIMEOUT = 10  # seconds
+TOTAL_TIMEOUT = 20  # seconds for a whole request, so a slow trickle of data still ends
+RATE = 5  # requests per second to D&D Beyond
+BURST = 10  # requests that can go out at once after a quiet period
+RETRIES = 2
+BREAKER_THRESHOLD = 5  # consecutive failures before requests stop being sent
+BREAKER_COOLDOWN = 30  # seconds before a probe request is allowed
+BACKOFF = 0.5  # seconds before the first retry, doubled after each failure
+MAX_BACKOFF = 30  # longest wait before giving up
+
+# request priorities, lower goes first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+NOT_FOUND = 'Could not find character\nYou may need to share it publicly'
+
+# top level character json read by Character
+CHARACTER_KEYS = (
+    'name', 'readonlyUrl', 'avatarUrl', 'themeColor', 'notes',
+    'stats', 'bonusStats', 'overrideStats', 'modifiers', 'characterValues', 'customProficiencies',
+    'classes', 'options', 'inventory', 'actions', 'customActions', 'spells', 'classSpells',
+)
 
 ROLL_EXPR = re.compile(r'\s*(.+?)\s*:\s*(.+)')
 
+metrics = Counter()
+
+
+def set_base_url(url):
+    '''
+    Points every request at another D&D Beyond, such as benchmarks.fakebeyond
+    '''
+    global URL_BASE, CHARACTER_URL, CONFIG_URL
+    URL_BASE = url.rstrip('/')
+    CHARACTER_URL = URL_BASE + "/character/{id}/json"
+    CONFIG_URL = URL_BASE + "/api/config/json"
+
 
 def slug(text):
     return text.lower().replace(' ', '-')
 
 
-class Character:
-    def __init__(self, id):
-        self.setup()
-        self.url = CHARACTER_URL.format(id=id)
-        r = requests.get(self.url)
-        if not r:
-            raise ValueError('Could not find character\nYou may need to share it publicly')
-        self.json = r.json()
-
-    def setup(self):
-        r = requests.get(CONFIG_URL)
-        if not r:
-            raise ValueError('Could not access D&D Beyond')
-        config = r.json()
-
-        self.stat_list = []
-        for stat in config['stats']:
-            name = slug(stat['name'])
-            self.stat_list.append(name)
-        self.skill_list = {}
-        self.skill_ids = {}
-        for skill in config['abilitySkills']:
+class Config:
+    '''
+    Game data from D&D Beyond shared by every character
+    Never modified after creation, reloading builds a new instance
+    '''
+    def __init__(self, json):
+        self.loaded = time.monotonic()
+
+        self.stat_list = tuple(slug(stat['name']) for stat in json['stats'])
+        skill_list = {}
+        skill_ids = {}
+        for skill in json['abilitySkills']:
             name = slug(skill['name'])
-            self.skill_list[name] = skill['stat']
-            self.skill_ids[skill['id']] = name
-
-        self.adjustment_types = {d['id']: d for d in config['adjustmentTypes']}
-        self.damage_types = {d['id']: slug(d['name']) for d in config['damageTypes']}
-
-        self.weapon_properties = {}
-        for prop in config['weaponProperties']:
-            name = slug(prop['name'])
-            self.weapon_properties[name] = prop['id']
-        self.weapon_categories = {}
-        self.weapons = {}
-        for c in config['weaponCategories']:
+            skill_list[name] = skill['stat']
+            skill_ids[skill['id']] = name
+        self.skill_list = MappingProxyType(skill_list)
+        self.skill_ids = MappingProxyType(skill_ids)
+
+        self.adjustment_types = MappingProxyType({d['id']: d for d in json['adjustmentTypes']})
+        self.damage_types = MappingProxyType({d['id']: slug(d['name']) for d in json['damageTypes']})
+
+        self.weapon_properties = MappingProxyType({slug(p['name']): p['id'] for p in json['weaponProperties']})
+        weapon_categories = {}
+        weapons = {}
+        for c in json['weaponCategories']:
             name = slug(c['name'])
-            self.weapon_categories[c['id']] = name
-            self.weapons[name] = []
-        for weapon in config['weapons']:
-            self.weapons[self.weapon_categories[weapon['categoryId']]].append(slug(weapon['name']))
+            weapon_categories[c['id']] = name
+            weapons[name] = []
+        for weapon in json['weapons']:
+            weapons[weapon_categories[weapon['categoryId']]].append(slug(weapon['name']))
+        self.weapon_categories = MappingProxyType(weapon_categories)
+        self.weapons = MappingProxyType({k: tuple(v) for k, v in weapons.items()})
+
+    @property
+    def age(self):
+        return time.monotonic() - self.loaded
+
+
+_session = None
+
+
+def get_session():
+    '''
+    Gets the shared http session, creating it on first use
+    Connections to D&D Beyond are pooled and kept alive between requests
+    '''
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=POOL_SIZE)
+        timeout = aiohttp.ClientTimeout(total=TOTAL_TIMEOUT, sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+_inflight = {}
+
+
+async def coalesce(key, factory, priority=None):
+    '''
+    Runs factory() once for all concurrent callers with the same key
+    Every caller gets the same result or exception
+    A caller joining with a higher priority moves the gateway request made under key ahead
+    '''
+    future = _inflight.get(key)
+    if future is not None:
+        metrics['coalesced'] += 1
+        if priority is not None:
+            gateway.promote(key, priority)
+    else:
+        future = asyncio.ensure_future(factory())
+        _inflight[key] = future
+        future.add_done_callback(lambda f: _inflight.pop(key, None))
+    # shielded so one cancelled caller does not cancel the fetch for the others
+    return await asyncio.shield(future)
+
+
+_config = None
+_config_digest = None  # hash of the response the shared config was built from
+
+
+async def get_config():
+    '''
+    Gets the shared config, loading it on first use
+    '''
+    if _config is None:
+        return await reload_config()
+    metrics['config_hit'] += 1
+    return _config
+
+
+async def reload_config():
+    '''
+    Fetches the config from D&D Beyond and replaces the shared instance
+    The old config stays in use if the fetch fails or the data has not changed,
+    so cached characters derived from it stay valid
+    '''
+    return await coalesce('config', _download_config)
+
+
+def loads_config(text):
+    '''
+    Parses config json along with a hash of the raw text
+    '''
+    if isinstance(text, str):
+        text = text.encode()
+    return hashlib.sha1(text).digest(), json.loads(text)
+
+
+async def _download_config():
+    global _config, _config_digest
+    try:
+        (digest, json), _, _ = await get_json(CONFIG_URL, loads=loads_config)
+    except ValueError:
+        metrics['config_error'] += 1
+        raise
+    if _config is not None and digest == _config_digest:
+        metrics['config_unchanged'] += 1
+        return _config
+    _config = Config(json)
+    _config_digest = digest
+    metrics['config_refresh'] += 1
+    return _config
+
+
+class BeyondError (ValueError):
+    '''
+    Base class for errors talking to D&D Beyond
+    '''
+
+
+class NotFound (BeyondError):
+    '''
+    D&D Beyond has nothing at the url, or it is not shared publicly
+    '''
+
+
+class RateLimited (BeyondError):
+    '''
+    D&D Beyond asked us to slow down
+    '''
+    def __init__(self, retry_after=None):
+        self.retry_after = retry_after
+        super().__init__('D&D Beyond is busy, try again in a few seconds')
+
+
+class Unavailable (BeyondError):
+    '''
+    D&D Beyond could not be reached or returned a server error
+    '''
+    def __init__(self, message='Could not access D&D Beyond'):
+        super().__init__(message)
+
+
+def parse_retry_after(value):
+    '''
+    Gets the seconds to wait from a Retry-After header, which is either seconds or an http date
+    '''
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+class CircuitOpen (Unavailable):
+    '''
+    Requests are not being sent because D&D Beyond keeps failing
+    '''
+    def __init__(self):
+        super().__init__('D&D Beyond is not responding, try again later')
+
+
+class CircuitBreaker:
+    '''
+    Stops sending requests to D&D Beyond after repeated failures
+
+    closed: requests go out as normal
+    open: requests fail immediately until the cooldown passes
+    half-open: a single probe request goes out, its result closes or reopens the circuit
+    '''
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None
+        self.probing = False
+
+    @property
+    def state(self):
+        if self.opened is None:
+            return 'closed'
+        if time.monotonic() - self.opened < self.cooldown:
+            return 'open'
+        return 'half-open'
+
+    def check(self):
+        '''
+        Raises CircuitOpen if a request should not be sent right now
+        Returns whether the request is the half-open probe
+        '''
+        state = self.state
+        if state == 'open' or (state == 'half-open' and self.probing):
+            metrics['breaker_rejected'] += 1
+            raise CircuitOpen()
+        if state == 'half-open':
+            self.probing = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened = None
+
+    def failure(self):
+        self.failures += 1
+        if self.state == 'half-open' or self.failures >= self.threshold:
+            if self.state != 'open':
+                metrics['breaker_opened'] += 1
+            self.opened = time.monotonic()
+
+
+class Gateway:
+    '''
+    The one path for requests to D&D Beyond
+    Rate limited with a token bucket, waiting requests go out in priority order
+    Failed requests are retried with exponential backoff, a 429 pauses every request
+    '''
+    def __init__(self, rate=RATE, burst=BURST):
+        self.breaker = CircuitBreaker()
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.waiters = []  # heap of (priority, order, future)
+        self.order = count()
+        self.priorities = {}  # request key -> priority, for requests that can be promoted
+        self.queued = {}  # request key -> future of the request while it waits for a token
+        self.wakeup = None
+
+    async def acquire(self, priority, key=None):
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.order), future))
+        if key is not None:
+            self.queued[key] = future
+        self.dispatch()
+        try:
+            await future
+        finally:
+            if key is not None and self.queued.get(key) is future:
+                del self.queued[key]
+
+    def promote(self, key, priority):
+        '''
+        Raises the priority of the request made under key, including any retries
+        A waiting request is pushed again at the new priority,
+        the old heap entry is skipped once the request has gone out
+        '''
+        if key not in self.priorities or self.priorities[key] <= priority:
+            return
+        self.priorities[key] = priority
+        future = self.queued.get(key)
+        if future is not None and not future.done():
+            heapq.heappush(self.waiters, (priority, next(self.order), future))
+            metrics['promoted'] += 1
+            self.dispatch()
+
+    def dispatch(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        while self.waiters and self.tokens >= 1 and now >= self.paused_until:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():  # skip requests whose caller was cancelled
+                self.tokens -= 1
+                future.set_result(None)
+        if self.waiters and self.wakeup is None:
+            delay = max(self.paused_until - now, (1 - self.tokens) / self.rate, 0)
+            self.wakeup = asyncio.get_event_loop().call_later(delay, self.wake)
+
+    def wake(self):
+        self.wakeup = None
+        self.dispatch()
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def get(self, url, headers=None, priority=INTERACTIVE, error='Could not access D&D Beyond', loads=json.loads,
+                  key=None):
+        '''
+        Fetches json from D&D Beyond
+        Returns (json, size in bytes, response headers), json is None for 304 Not Modified
+        A request with a key can be moved ahead with promote(key, priority) while it runs
+        '''
+        if key is None:
+            return await self.fetch(url, headers, priority, error, loads)
+        self.priorities[key] = priority
+        try:
+            return await self.fetch(url, headers, priority, error, loads, key)
+        finally:
+            del self.priorities[key]
+
+    async def fetch(self, url, headers, priority, error, loads, key=None):
+        backoff = BACKOFF
+        for attempt in range(RETRIES + 1):
+            probe = self.breaker.check()
+            try:
+                await self.acquire(self.priorities.get(key, priority), key)
+            except asyncio.CancelledError:
+                if probe:
+                    self.breaker.probing = False
+                raise
+            try:
+                return await self.request(url, headers, error, loads)
+            except CircuitOpen:
+                raise
+            except RateLimited as e:
+                metrics['rate_limited'] += 1
+                wait = backoff if e.retry_after is None else e.retry_after
+                if attempt == RETRIES or wait > MAX_BACKOFF:
+                    raise
+                self.pause(wait)
+            except Unavailable:
+                metrics['unavailable'] += 1
+                if attempt == RETRIES:
+                    raise
+                await asyncio.sleep(backoff * random.uniform(1, 1.5))
+            metrics['retry'] += 1
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+    async def request(self, url, headers, error, loads):
+        try:
+            result = await self.send(url, headers, error, loads)
+        except Unavailable:
+            self.breaker.failure()
+            raise
+        except BeyondError:
+            # D&D Beyond answered, so it is up
+            self.breaker.success()
+            raise
+        finally:
+            self.breaker.probing = False
+        self.breaker.success()
+        return result
+
+    async def send(self, url, headers, error, loads):
+        try:
+            async with get_session().get(url, headers=headers) as r:
+                if r.status == 304:
+                    return None, 0, r.headers
+                if r.status == 429:
+                    raise RateLimited(parse_retry_after(r.headers.get('Retry-After')))
+                if r.status >= 500:
+                    raise Unavailable()
+                if r.status >= 400:
+                    raise NotFound(error)
+                body = await r.read()
+                # a blank, truncated or garbled body is an outage, not a missing character or a 304
+                if not body.strip():
+                    raise Unavailable()
+                try:
+                    data = loads(body.decode('utf-8'))
+                except ValueError:
+                    raise Unavailable()
+                if data is None:
+                    raise Unavailable()
+                return data, len(body), r.headers
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            raise Unavailable()
+
+
+gateway = Gateway()
+
+
+async def get_json(url, headers=None, priority=INTERACTIVE, error='Could not access D&D Beyond', loads=json.loads,
+                   key=None):
+    return await gateway.get(url, headers, priority=priority, error=error, loads=loads, key=key)
+
+
+def loads_character(text):
+    '''
+    Parses character json keeping only the top-level keys that Character reads
+    '''
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError('Character json is not an object')
+    return {key: data[key] for key in CHARACTER_KEYS if key in data}
+
+
+class CacheEntry:
+    __slots__ = ('snapshot', 'size', 'config', 'etag', 'last_modified', 'fetched')
+
+    def __init__(self, snapshot, size, config, etag=None, last_modified=None, fetched=None):
+        self.snapshot = snapshot
+        self.size = size
+        self.config = config
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched = time.monotonic() if fetched is None else fetched
+
+    @property
+    def age(self):
+        return time.monotonic() - self.fetched
+
+
+class CharacterCache:
+    '''
+    Least recently used cache of character snapshots keyed by character id
+    Bounded by the total in-memory size of the snapshots in bytes
+    '''
+    def __init__(self, max_bytes=CACHE_BYTES, ttl=CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, id):
+        entry = self.entries.get(id)
+        if entry is not None:
+            self.entries.move_to_end(id)
+        return entry
+
+    def put(self, id, entry):
+        self.pop(id)
+        if entry.size > self.max_bytes:
+            return
+        self.entries[id] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            _, old = self.entries.popitem(last=False)
+            self.size -= old.size
+            metrics['character_evict'] += 1
+
+    def pop(self, id):
+        entry = self.entries.pop(id, None)
+        if entry is not None:
+            self.size -= entry.size
+        return entry
+
+    def is_fresh(self, entry):
+        return entry.age < self.ttl
+
+    def expires_in(self, id):
+        '''
+        Seconds until the entry for id needs revalidating, None if it is not cached
+        '''
+        entry = self.entries.get(id)
+        if entry is None:
+            return None
+        return self.ttl - entry.age
+
+
+character_cache = CharacterCache()
+
+# persistent storage for snapshots, set up by the bot
+# needs coroutines load(id) -> (data, fetched datetime) or None, save(id, data)
+# and touch(id), which marks the stored snapshot as fetched now
+snapshot_store = None
+
+
+async def load_character(id, priority=INTERACTIVE):
+    '''
+    Gets the snapshot of a character, using the cache while it is fresh
+    Expired entries are revalidated with the ETag/Last-Modified of the cached response
+    '''
+    config = await get_config()
+    entry = character_cache.get(id)
+    if entry is not None and entry.config is config and character_cache.is_fresh(entry):
+        metrics['character_hit'] += 1
+        return entry.snapshot
+    if entry is None:
+        entry = await restore_character(id, config)
+        if entry is not None:
+            if character_cache.is_fresh(entry):
+                return entry.snapshot
+            refresh_character(id)
+            # warm restart data is only marked as an offline copy while D&D Beyond is down
+            if gateway.breaker.state == 'closed':
+                return entry.snapshot
+            metrics['served_stale'] += 1
+            return entry.snapshot.as_stale(entry.age)
+    try:
+        return await coalesce(('character', id), lambda: _download_character(id, priority), priority)
+    except (Unavailable, RateLimited):
+        # D&D Beyond is down or throttling, the last known sheet beats no answer
+        if entry is None:
+            raise
+        metrics['served_stale'] += 1
+        return entry.snapshot.as_stale(entry.age)
+
+
+async def restore_character(id, config):
+    '''
+    Puts the stored snapshot of a character in the cache
+    Returns the new cache entry, or None if there is no usable snapshot
+    '''
+    if snapshot_store is None:
+        return None
+    stored = await snapshot_store.load(id)
+    if stored is None:
+        return None
+    data, fetched = stored
+    try:
+        snapshot = CharacterSnapshot.from_bytes(data)
+    except ValueError:
+        return None
+    age = (datetime.utcnow() - fetched).total_seconds()
+    entry = CacheEntry(snapshot, snapshot.memory_size(), config, fetched=time.monotonic() - age)
+    character_cache.put(id, entry)
+    metrics['character_restored'] += 1
+    return entry
+
+
+def refresh_character(id):
+    '''
+    Fetches a character in the background, replacing its cached snapshot
+    '''
+    def done(future):
+        if not future.cancelled() and future.exception() is not None:
+            metrics['refresh_error'] += 1
+
+    future = asyncio.ensure_future(coalesce(('character', id), lambda: _download_character(id, BACKGROUND)))
+    future.add_done_callback(done)
+    return future
+
+
+def update_store(coro):
+    '''
+    Runs a snapshot store update in the background, so a slow database never delays a command
+    '''
+    def done(future):
+        if not future.cancelled() and future.exception() is not None:
+            metrics['snapshot_store_error'] += 1
+
+    future = asyncio.ensure_future(coro)
+    future.add_done_callback(done)
+    return future
+
+
+async def _download_character(id, priority):
+    config = await get_config()
+    entry = character_cache.get(id)
+    headers = {}
+    # snapshots derived from an old config have to be rebuilt from a full response
+    if entry is not None and entry.config is config:
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+    url = CHARACTER_URL.format(id=id)
+    json, _, response_headers = await get_json(
+        url, headers, priority=priority, error=NOT_FOUND, loads=loads_character, key=('character', id))
+    if json is None and entry is not None:
+        metrics['character_revalidated'] += 1
+        entry.fetched = time.monotonic()
+        if snapshot_store is not None:
+            # so the stored copy is not mistaken for an old one after a restart
+            update_store(snapshot_store.touch(id))
+        return entry.snapshot
+
+    snapshot = Character(id, json, config).snapshot()
+    data = snapshot.to_bytes()
+    entry = CacheEntry(
+        snapshot, snapshot.memory_size(), config, response_headers.get('ETag'), response_headers.get('Last-Modified'))
+    character_cache.put(id, entry)
+    if snapshot_store is not None:
+        update_store(snapshot_store.save(id, data))
+    metrics['character_fetch'] += 1
+    return snapshot
+
+
+class Character:
+    def __init__(self, id, json, config):
+        self.setup(config)
+        self.id = id
+        self.url = CHARACTER_URL.format(id=id)
+        self.json = json
+
+    @classmethod
+    async def load(cls, id):
+        '''
+        Fetches the full character and the shared config without blocking the event loop
+        Commands should use load_character, which caches compact snapshots instead
+        '''
+        config = await get_config()
+        json, _, _ = await get_json(CHARACTER_URL.format(id=id), error=NOT_FOUND)
+        return cls(id, json, config)
+
+    def setup(self, config):
+        self.config = config
+        self.stat_list = config.stat_list
+        self.skill_list = config.skill_list
+        self.skill_ids = config.skill_ids
+        self.adjustment_types = config.adjustment_types
+        self.damage_types = config.damage_types
+        self.weapon_properties = config.weapon_properties
+        self.weapon_categories = config.weapon_categories
+        self.weapons = config.weapons
 
     @property
     def adjustments(self):
@@ -73,19 +698,36 @@ class Character:
     def name(self):
         return self.json['name']
 
+    @property
+    def modifier_index(self):
+        if not hasattr(self, '_modifier_index'):
+            by_type = defaultdict(list)
+            by_subtype = defaultdict(list)
+            for modtype in self.json['modifiers'].values():
+                for mod in modtype:
+                    by_type[mod['type']].append(mod)
+                    by_subtype[mod['type'], mod['subType']].append(mod)
+            self._modifier_index = (dict(by_type), dict(by_subtype))
+        return self._modifier_index
+
+    def get_modifiers(self, type, subType=None):
+        '''
+        Gets the modifiers of a type, optionally only those for one subType
+        '''
+        by_type, by_subtype = self.modifier_index
+        if subType is None:
+            return by_type.get(type, ())
+        return by_subtype.get((type, subType), ())
+
     def get_value(self, stat, base=0):
         """Calculates the final value of a stat, based on modifiers and feats..."""
         setval = None
-        for modtype in self.json['modifiers'].values():
-            for mod in modtype:
-                if not mod['subType'] == stat:
-                    pass
-                elif mod['type'] == 'bonus':
-                    base += mod['value'] or self.get_mod(mod['statId'])
-                elif mod['type'] == 'set':
-                    temp = mod['value'] or self.get_mod(mod['statId'])
-                    if setval is None or temp > setval:
-                        setval = temp
+        for mod in self.get_modifiers('bonus', stat):
+            base += mod['value'] or self.get_mod(mod['statId'])
+        for mod in self.get_modifiers('set', stat):
+            temp = mod['value'] or self.get_mod(mod['statId'])
+            if setval is None or temp > setval:
+                setval = temp
 
         if setval is not None:
             return max(base, setval)
@@ -179,18 +821,18 @@ class Character:
         overrides = {}
 
         # get modifiers
-        for modtype in self.json['modifiers'].values():
-            for mod in modtype:
+        for mod in self.get_modifiers('half-proficiency'):
+            name = mod['subType']
+            profs[name] = max(profs.get(name, 0), 2)
+        for mod in self.get_modifiers('proficiency'):
+            name = mod['subType']
+            profs[name] = max(profs.get(name, 0), 3)
+        for mod in self.get_modifiers('expertise'):
+            profs[mod['subType']] = 4
+        for mod in self.get_modifiers('bonus'):
+            if mod['isGranted']:
                 name = mod['subType']
-                if mod['type'] == 'half-proficiency':
-                    profs[name] = max(profs.get(name, 0), 2)
-                elif mod['type'] == 'proficiency':
-                    profs[name] = max(profs.get(name, 0), 3)
-                elif mod['type'] == 'expertise':
-                    profs[name] = 4
-                elif mod['type'] == 'bonus':
-                    if mod['isGranted']:
-                        bonuses[name] = bonuses.get(name, 0) + mod['value']
+                bonuses[name] = bonuses.get(name, 0) + mod['value']
 
         for i, skill in enumerate(self.skill_list.keys()):
             skills[skill] = self.get_mod(self.skill_list[skill])
@@ -281,14 +923,12 @@ class Character:
     def get_prof(self, proftype=None):
         if not hasattr(self, 'profs'):
             p = set()
-            for modtype in self.json['modifiers'].values():
-                for mod in modtype:
-                    if mod['type'] == 'proficiency':
-                        if mod['subType'] == 'simple-weapons':
-                            p.update(map(str.lower, self.weapons.get('simple', [])))
-                        elif mod['subType'] == 'martial-weapons':
-                            p.update(map(str.lower, self.weapons.get('martial', [])))
-                        p.add(mod['friendlySubtypeName'].lower())
+            for mod in self.get_modifiers('proficiency'):
+                if mod['subType'] == 'simple-weapons':
+                    p.update(map(str.lower, self.weapons.get('simple', [])))
+                elif mod['subType'] == 'martial-weapons':
+                    p.update(map(str.lower, self.weapons.get('martial', [])))
+                p.add(mod['friendlySubtypeName'].lower())
             self.profs = p
         return proftype.lower() in self.profs
 
@@ -517,8 +1157,11 @@ class Character:
     @property
     def attacks(self):
         """Returns a list of dicts of all of the character's attacks."""
+        if hasattr(self, '_attacks'):
+            return self._attacks
+
         attacks = []
-        used_names = []
+        used_names = set()
 
         def extend(parsed_attacks):
             for atk in parsed_attacks:
@@ -527,8 +1170,8 @@ class Character:
                     while f"{atk['name']}{num}" in used_names:
                         num += 1
                     atk['name'] = f"{atk['name']}{num}"
+                used_names.add(atk['name'])
             attacks.extend(parsed_attacks)
-            used_names.extend(a['name'] for a in parsed_attacks)
 
         for src in self.json['actions'].values():
             for action in src:
@@ -552,8 +1195,20 @@ class Character:
                 if spell['displayAsAttack'] if daa is None else daa:
                     stat = self.classes[spells['characterClassId']]['definition']['spellCastingAbilityId']
                     extend(self.get_spell_attack(spell['definition'], stat))
+
+        self._attacks = attacks
         return attacks
 
+    @property
+    def attacks_by_name(self):
+        """Returns a dict of the character's attacks keyed by lowercase name."""
+        if not hasattr(self, '_attacks_by_name'):
+            attacks = {}
+            for attack in self.attacks:
+                attacks.setdefault(attack['name'].lower(), attack)
+            self._attacks_by_name = attacks
+        return self._attacks_by_name
+
     # ----#-   Custom getters
 
     def custom_rolls(self):
@@ -601,17 +1256,261 @@ class Character:
             'icon_url': self.json['avatarUrl'],
         }
 
+    def snapshot(self):
+        return CharacterSnapshot.from_character(self)
+
+
+def deep_size(obj, seen=None):
+    '''
+    The size in bytes of an object and everything it contains, counting shared objects once
+    '''
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    return size
+
+
+class CharacterSnapshot:
+    '''
+    The derived data of a character that the commands use
+    Holds none of the raw json so thousands can be cached at once
+    '''
+    __slots__ = (
+        'id', 'name', 'url', 'avatar', 'theme', 'stat_list',
+        'stats', 'skills', 'ac', 'levels', 'classes', 'attacks', 'rolls',
+        'stale', '_attacks_by_name',
+    )
+    FORMAT = 1  # bump when the serialized layout changes
+
+    def __init__(self, id, name, url, avatar, theme, stat_list, stats, skills, ac, levels, classes, attacks, rolls):
+        self.id = id
+        self.name = name
+        self.url = url
+        self.avatar = avatar
+        self.theme = theme
+        self.stat_list = tuple(stat_list)
+        self.stats = stats
+        self.skills = OrderedDict(skills)
+        self.ac = ac
+        self.levels = levels
+        self.classes = tuple(map(tuple, classes))
+        self.attacks = tuple(attacks)
+        self.rolls = rolls
+        self.stale = None  # seconds since the data was fetched, if D&D Beyond could not be reached
+
+    @classmethod
+    def from_character(cls, character):
+        classes = []
+        for c in character.json['classes']:
+            name = c['definition']['name']
+            if c['subclassDefinition'] is not None:
+                name = f"{c['subclassDefinition']['name']} {name}"
+            classes.append((name, c['level']))
+        return cls(
+            id=character.id,
+            name=character.name,
+            url=character.json['readonlyUrl'],
+            avatar=character.json['avatarUrl'],
+            theme=character.color(),
+            stat_list=character.stat_list,
+            stats=character.stats,
+            skills=character.skills,
+            ac=character.ac,
+            levels=character.levels,
+            classes=classes,
+            attacks=character.attacks,
+            rolls=character.custom_rolls(),
+        )
+
+    def to_bytes(self):
+        data = [
+            self.FORMAT, self.id, self.name, self.url, self.avatar, self.theme, self.stat_list,
+            self.stats, list(self.skills.items()), self.ac, self.levels, self.classes, self.attacks, self.rolls,
+        ]
+        return zlib.compress(json.dumps(data, separators=(',', ':')).encode())
+
+    @classmethod
+    def from_bytes(cls, data):
+        version, *data = json.loads(zlib.decompress(data).decode())
+        if version != cls.FORMAT:
+            raise ValueError('Unknown snapshot format: {}'.format(version))
+        return cls(*data)
+
+    def memory_size(self):
+        '''
+        Estimates the bytes of memory the snapshot holds
+        '''
+        return deep_size([getattr(self, name) for name in self.__slots__ if hasattr(self, name)]) + sys.getsizeof(self)
+
+    @property
+    def attacks_by_name(self):
+        try:
+            return self._attacks_by_name
+        except AttributeError:
+            attacks = {}
+            for attack in self.attacks:
+                attacks.setdefault(attack['name'].lower(), attack)
+            self._attacks_by_name = attacks
+            return attacks
+
+    def as_stale(self, age):
+        '''
+        Gets a copy marked as out of date by age seconds
+        '''
+        snapshot = copy(self)
+        snapshot.stale = age
+        return snapshot
+
+    def get_mod(self, name):
+        return self.stats[name[:3] + 'mod']
+
+    def custom_rolls(self):
+        return self.rolls
+
+    def color(self):
+        return self.theme
+
+    def embed_fields(self):
+        overview = (
+            f"**Level:** {self.levels['character']}\n"
+            f"**AC:** {self.ac}\n"
+        )
+        yield {'name': 'Overview', 'value': overview, 'inline': True}
+        for name, level in self.classes:
+            yield {'name': name, 'value': f"**Level:** {level}", 'inline': True}
+        stat_list = [s[:3] for s in self.stat_list]
+        stats = ("**{}:** {} ({:+d})".format(s, self.stats[s], self.get_mod(s)) for s in stat_list)
+        yield {'name': 'Stats', 'value': '\n'.join(stats), 'inline': True}
+        saves = ("**{}:** {:+d}".format(s, self.skills[s + 'save']) for s in stat_list)
+        yield {'name': 'Saving Throws', 'value': '\n'.join(saves), 'inline': True}
+
+    def embed_author(self):
+        name = self.name
+        if self.stale is not None:
+            minutes = int(self.stale // 60)
+            name += f" (offline copy from {minutes} min ago)"
+        return {
+            'name': name,
+            'url': self.url,
+            'icon_url': self.avatar,
+        }
+
+
+# ----#-   Batch processing
+
+_batch_config = None
+
+
+def _batch_init(config_json):
+    global _batch_config
+    _batch_config = Config(config_json)
+
+
+def compute_sheet(id, text):
+    '''
+    Parses and derives one character in a batch worker process
+    '''
+    start = time.perf_counter()
+    data = loads_character(text)
+    parsed = time.perf_counter()
+    character = Character(id, data, _batch_config)
+    result = {
+        'id': id,
+        'name': character.name,
+        'stats': character.stats,
+        'skills': character.skills,
+        'saves': {s[:3]: character.skills[s[:3] + 'save'] for s in character.stat_list},
+        'ac': character.ac,
+        'attacks': character.attacks,
+    }
+    result['timing'] = {
+        'parse': parsed - start,
+        'derive': time.perf_counter() - parsed,
+    }
+    return result
+
+
+async def batch(sources, output, config_json=None, workers=None, concurrency=POOL_SIZE):
+    '''
+    Computes the sheets of many characters, writing one json line per character to output
+    Sources are character ids to fetch or paths to saved character json
+    Fetching runs concurrently on the event loop, parsing runs in a pool of processes
+    '''
+    if config_json is None:
+        config_json, _, _ = await get_json(CONFIG_URL)
+    loop = asyncio.get_event_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(pool, source):
+        start = time.perf_counter()
+        try:
+            if isinstance(source, int):
+                id = source
+                async with semaphore:
+                    text, _, _ = await get_json(CHARACTER_URL.format(id=id), error=NOT_FOUND, loads=str)
+            else:
+                id = os.path.splitext(os.path.basename(source))[0]
+                id = int(id) if id.isdigit() else id
+                with open(source) as f:
+                    text = f.read()
+            fetched = time.perf_counter()
+            result = await loop.run_in_executor(pool, compute_sheet, id, text)
+            result['timing']['fetch'] = fetched - start
+            result['timing']['total'] = time.perf_counter() - start
+        except Exception as e:
+            # one bad character, unreadable file or crashed worker is reported without stopping the batch
+            result = {'id': id, 'error': '{}: {}'.format(type(e).__name__, e)}
+        output.write(json.dumps(result) + '\n')
+
+    with ProcessPoolExecutor(workers, initializer=_batch_init, initargs=(config_json,)) as pool:
+        await asyncio.gather(*(process(pool, source) for source in sources))
+
 
 if __name__ == '__main__':
-    import sys
-    id = sys.argv[1]
-    character = Character(id)
-    print(character.name)
-    # print('ac:', character.ac)
-    # print(character.levels)
-    # pprint(character.classes, depth=3)
-    # print(character.fighting_styles)
-    # pprint(character.adjustments)
-    # pprint(character.stats)
-    # pprint(character.skills)
-    # pprint(character.attacks)
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Computes the sheets of D&D Beyond characters as json lines')
+    parser.add_argument('sources', nargs='+', help='character ids, saved character json files or directories of them')
+    parser.add_argument('-o', '--output', help='file to write to, defaults to stdout')
+    parser.add_argument('--config', help='saved config json, fetched from D&D Beyond if not given')
+    parser.add_argument('--workers', type=int, help='parsing processes, defaults to the number of cpus')
+    parser.add_argument('--concurrency', type=int, default=POOL_SIZE, help='simultaneous fetches')
+    parser.add_argument('--base-url', help='D&D Beyond url to fetch from, such as a benchmarks.fakebeyond server')
+    args = parser.parse_args()
+    if args.base_url is not None:
+        set_base_url(args.base_url)
+
+    sources = []
+    for source in args.sources:
+        if source.isdigit():
+            sources.append(int(source))
+        elif os.path.isdir(source):
+            for name in sorted(os.listdir(source)):
+                if name.endswith('.json') and name != 'config.json':
+                    sources.append(os.path.join(source, name))
+            if args.config is None and os.path.exists(os.path.join(source, 'config.json')):
+                args.config = os.path.join(source, 'config.json')
+        else:
+            sources.append(source)
+
+    config_json = None
+    if args.config is not None:
+        with open(args.config) as f:
+            config_json = json.load(f)
+
+    async def main():
+        try:
+            await batch(sources, output, config_json, args.workers, args.concurrency)
+        finally:
+            await close_session()
+
+    output = sys.stdout if args.output is None else open(args.output, 'w')
+    with output:
+        asyncio.get_event_loop().run_until_complete(main())
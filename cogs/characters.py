@@ -12,6 +12,23 @@ SHARE_URL = re.compile(r'(?:https://)?ddb\.ac/characters/(\d+)/\w+')
 NUMBER_EXPR = re.compile(r'(\d+)')
 
 
+def set_claim(session, server, user, character):
+    claim = session.query(m.Character).get((server, user))
+    if claim is not None:
+        claim.character = character
+    else:
+        claim = m.Character(server=server, user=user, character=character)
+        session.add(claim)
+    session.commit()
+
+
+def delete_claim(session, server, user):
+    claim = session.query(m.Character).get((server, user))
+    if claim is not None:
+        session.delete(claim)
+        session.commit()
+
+
 def make_embed(character):
     embed = discord.Embed(color=character.color())
     author = character.embed_author()
@@ -32,14 +49,8 @@ class CharacterCategory (util.Cog):
                 break
         else:
             raise commands.BadArgument('id')
-        character = util.get_character(id)
-        claim = ctx.session.query(m.Character).get((ctx.guild.id, ctx.author.id))
-        if claim is not None:
-            claim.character = id
-        else:
-            claim = m.Character(server=ctx.guild.id, user=ctx.author.id, character=id)
-            ctx.session.add(claim)
-        ctx.session.commit()
+        character = await util.get_character(id)
+        await self.bot.db.run('iam', set_claim, ctx.guild.id, ctx.author.id, id)
         embed = make_embed(character)
         msg = await ctx.send(embed=embed)
         await msg.add_reaction(util.delete_emoji)
@@ -48,7 +59,7 @@ class CharacterCategory (util.Cog):
     @commands.command(ignore_extra=False)
     async def whois(self, ctx, *, user: discord.Member):
         try:
-            character = util.get_character(ctx, user.id)
+            character = await util.get_character(ctx, user.id)
         except LookupError:
             embed = discord.Embed(description='User has no character')
         else:
@@ -63,10 +74,7 @@ class CharacterCategory (util.Cog):
 
     @commands.command(ignore_extra=False)
     async def unclaim(self, ctx):
-        claim = ctx.session.query(m.Character).get((ctx.guild.id, ctx.author.id))
-        if claim is not None:
-            ctx.session.delete(claim)
-            ctx.session.commit()
+        await self.bot.db.run('unclaim', delete_claim, ctx.guild.id, ctx.author.id)
         embed = discord.Embed(description='Done')
         msg = await ctx.send(embed=embed)
         await msg.add_reaction(util.delete_emoji)
@@ -8,12 +8,12 @@ from . import rolls
 class CustomRollCategory (util.Cog):
     @commands.group('customroll', aliases=['cr'], invoke_without_command=True)
     async def group(self, ctx, *, name: str):
-        name = util.strip_quotes(name)
+        name, count, keep = rolls.parse_repeat(util.strip_quotes(name))
 
         if not hasattr(ctx, 'advantage'):
             ctx.advantage = 0
 
-        character = util.get_character(ctx, ctx.author.id)
+        character = await util.get_character(ctx, ctx.author.id)
         roll = character.custom_rolls().get(name.lower())
         if roll is None:
             raise ValueError('No roll with that name')
@@ -25,9 +25,10 @@ class CustomRollCategory (util.Cog):
 
         embed = discord.Embed(color=character.color())
         embed.set_author(**character.embed_author())
-        text = []
-        rolls.do_roll(roll, advantage=ctx.advantage, output=text)
-        embed.add_field(name=name, value='\n'.join(text), inline=False)
+        text = rolls.Transcript()
+        await rolls.do_roll_async(roll, advantage=ctx.advantage, output=text, count=count, keep=keep,
+                                  loop=ctx.bot.loop)
+        embed.add_field(name=name, value=text.render(rolls.FIELD_LIMIT), inline=False)
         await ctx.send(embed=embed)
 
     @group.command(aliases=['a', 'adv'])
@@ -42,7 +43,7 @@ class CustomRollCategory (util.Cog):
 
     @group.command(ignore_extra=False)
     async def list(self, ctx):
-        character = util.get_character(ctx, ctx.author.id)
+        character = await util.get_character(ctx, ctx.author.id)
         rolls = map("**{0[0]}:** {0[1]}".format, character.custom_rolls().items())
         embed = discord.Embed(title='Custom Rolls', description='\n'.join(rolls), color=character.color())
         embed.set_author(**character.embed_author())
@@ -0,0 +1,92 @@
+'''
+Runs database work on a bounded thread pool so a slow query never blocks the event loop
+'''
+
+import time
+import asyncio
+import threading
+from collections import defaultdict
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+
+THREADS = 4  # queries run at once, the connection pool holds the same number of connections
+POOL_TIMEOUT = 30  # seconds a query waits for a connection before failing
+
+
+def connect(database, threads=THREADS):
+    '''
+    Creates an engine with one pooled connection per database thread
+    '''
+    if make_url(database).get_backend_name() == 'sqlite':
+        # sqlite pools connections per thread or not at all
+        return create_engine(database)
+    return create_engine(database, pool_size=threads, max_overflow=0, pool_timeout=POOL_TIMEOUT)
+
+
+class Timing:
+    '''
+    Queue wait and query time for one call site, in seconds
+    '''
+    __slots__ = ('count', 'wait', 'max_wait', 'query', 'max_query')
+
+    def __init__(self):
+        self.count = 0
+        self.wait = 0
+        self.max_wait = 0
+        self.query = 0
+        self.max_query = 0
+
+    def add(self, wait, query):
+        self.count += 1
+        self.wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.query += query
+        self.max_query = max(self.max_query, query)
+
+    def describe(self, site):
+        return '{}: {} calls, wait {:.1f}/{:.1f} ms, query {:.1f}/{:.1f} ms (mean/max)'.format(
+            site, self.count,
+            1000 * self.wait / self.count, 1000 * self.max_wait,
+            1000 * self.query / self.count, 1000 * self.max_query)
+
+
+class Database:
+    '''
+    Calls functions of a session on a pool of threads
+    Each call gets its own session, closed when the call returns,
+    so functions should return plain values rather than mapped objects
+    '''
+    def __init__(self, Session, threads=THREADS):
+        self.Session = Session
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.timings = defaultdict(Timing)  # call site -> Timing
+        self.lock = threading.Lock()  # guards timings, written from every database thread
+
+    async def run(self, site, func, *args):
+        '''
+        Returns func(session, *args), run on a database thread
+        site names the caller in the timings
+        '''
+        queued = time.perf_counter()
+
+        def call():
+            started = time.perf_counter()
+            try:
+                with closing(self.Session()) as session:
+                    return func(session, *args)
+            finally:
+                with self.lock:
+                    self.timings[site].add(started - queued, time.perf_counter() - started)
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, call)
+
+    def report(self):
+        '''
+        Lists the timings of every call site
+        '''
+        with self.lock:
+            return '\n'.join(timing.describe(site) for site, timing in sorted(self.timings.items()))
@@ -0,0 +1,271 @@
+'''
+Exact probability distributions for dice expressions
+'''
+
+import operator
+from functools import lru_cache
+
+import numpy
+
+MAX_OUTCOMES = 1_000_000  # most distinct outcomes a distribution may have
+MAX_PAIRS = 4_000_000  # most outcome pairs combined by a general binary operation
+MAX_MAGNITUDE = 2 ** 53  # largest outcome that is still exact as a float
+FFT_SIZE = 1_000_000  # convolutions bigger than this (len(a) * len(b)) use the FFT
+TINY = numpy.finfo(numpy.float64).tiny
+MAX_POOLS = 1000  # most (count, sides) combinations one dice operator may mix
+CACHED_POOL = 10_000  # largest count * sides of a dice pool whose distribution is cached
+
+# numpy versions of the binary operations, applied to every pair of outcomes
+UFUNCS = {
+    operator.add: numpy.add,
+    operator.sub: numpy.subtract,
+    operator.mul: numpy.multiply,
+    operator.truediv: numpy.true_divide,
+    operator.floordiv: numpy.floor_divide,
+    operator.mod: numpy.mod,
+    operator.pow: numpy.power,
+}
+
+
+class DistributionError (ValueError):
+    '''
+    The distribution is too large or undefined
+    '''
+
+
+class Distribution:
+    '''
+    The outcomes of a random value and their probabilities
+    Outcomes are sorted and unique, probabilities sum to 1
+    '''
+    __slots__ = ('values', 'probs')
+
+    def __init__(self, values, probs):
+        values = numpy.asarray(values)
+        probs = numpy.asarray(probs, dtype=numpy.float64)
+        if values.size and numpy.abs(values).max() > MAX_MAGNITUDE:
+            raise DistributionError('Outcomes are too large to compute exactly')
+        # integral floats are kept as integers so they can be convolved
+        if values.dtype.kind == 'f' and numpy.all(numpy.mod(values, 1) == 0):
+            values = values.astype(numpy.int64)
+        values, inverse = numpy.unique(values, return_inverse=True)
+        probs = numpy.bincount(inverse.ravel(), weights=probs.ravel(), minlength=len(values))
+        keep = probs > 0
+        self.values = values[keep]
+        self.probs = probs[keep] / probs[keep].sum()
+        if len(self.values) > MAX_OUTCOMES:
+            raise DistributionError('Too many possible outcomes to compute exactly')
+
+    @classmethod
+    def constant(cls, value):
+        return cls([value], [1])
+
+    @classmethod
+    def uniform(cls, faces):
+        return cls(faces, numpy.ones(len(faces)))
+
+    @property
+    def integral(self):
+        return self.values.dtype.kind in 'iu'
+
+    def dense(self):
+        '''
+        Returns (lowest outcome, probability of every integer from there to the highest)
+        '''
+        low = int(self.values[0])
+        probs = numpy.zeros(self.span())
+        probs[self.values - low] = self.probs
+        return low, probs
+
+    @classmethod
+    def from_dense(cls, low, probs):
+        return cls(numpy.arange(low, low + len(probs)), probs)
+
+    # ----#-   Operations
+
+    def map(self, func):
+        '''
+        Applies a function of one number to every outcome
+        '''
+        values = numpy.array([func(v) for v in self.values.tolist()])
+        return Distribution(values, self.probs)
+
+    def combine(self, other, func):
+        '''
+        Applies a function of two numbers to every pair of independent outcomes
+        '''
+        if func is operator.add:
+            return self + other
+        if func is operator.sub:
+            return self + other.map(operator.neg)
+        if func is max:
+            return self.maximum(other)
+        if func is min:
+            return self.minimum(other)
+
+        if func in (operator.truediv, operator.floordiv, operator.mod) and numpy.any(other.values == 0):
+            raise DistributionError('Division by zero is possible')
+        if func is operator.pow:
+            # checked as floats first, integer powers overflow silently
+            with numpy.errstate(over='ignore'):
+                powers = numpy.power(self.values[:, None].astype(float), other.values)
+            if numpy.any(numpy.abs(powers) > MAX_MAGNITUDE):
+                raise DistributionError('Outcomes are too large to compute exactly')
+            if numpy.any(other.values < 0):
+                return Distribution(self.values.astype(float), self.probs).pairs(other, numpy.power)
+        ufunc = UFUNCS.get(func)
+        if ufunc is not None:
+            return self.pairs(other, ufunc)
+        return self.pairs(other, numpy.frompyfunc(func, 2, 1))
+
+    def pairs(self, other, ufunc):
+        '''
+        Applies a numpy ufunc to every pair of outcomes
+        '''
+        if len(self.values) * len(other.values) > MAX_PAIRS:
+            raise DistributionError('Too many possible outcomes to compute exactly')
+        values = ufunc(self.values[:, None], other.values[None, :])
+        if values.dtype == object:
+            values = values.astype(float)
+        return Distribution(values, self.probs[:, None] * other.probs[None, :])
+
+    def span(self):
+        return int(self.values[-1]) - int(self.values[0]) + 1
+
+    def __add__(self, other):
+        if not (self.integral and other.integral) or max(self.span(), other.span()) > MAX_OUTCOMES:
+            return self.pairs(other, numpy.add)
+        a_low, a = self.dense()
+        b_low, b = other.dense()
+        return Distribution.from_dense(a_low + b_low, convolve(a, b))
+
+    def maximum(self, other):
+        values = numpy.union1d(self.values, other.values)
+        cdf = self.cdf(values) * other.cdf(values)
+        return Distribution(values, numpy.diff(cdf, prepend=0))
+
+    def minimum(self, other):
+        values = numpy.union1d(self.values, other.values)
+        survival = (1 - self.cdf(values, strict=True)) * (1 - other.cdf(values, strict=True))
+        return Distribution(values, -numpy.diff(survival, append=0))
+
+    def repeat(self, n):
+        '''
+        The distribution of the sum of n independent copies
+        '''
+        if n == 0:
+            return Distribution.constant(0)
+        result = None
+        power = self
+        while n:
+            if n & 1:
+                result = power if result is None else result + power
+            n >>= 1
+            if n:
+                power = power + power
+        return result
+
+    # ----#-   Statistics
+
+    def cdf(self, x, strict=False):
+        '''
+        P(outcome <= x), or P(outcome < x) if strict
+        '''
+        cumulative = numpy.concatenate([[0], numpy.cumsum(self.probs)])
+        side = 'left' if strict else 'right'
+        return numpy.minimum(cumulative[numpy.searchsorted(self.values, x, side=side)], 1)
+
+    @property
+    def mean(self):
+        return float(numpy.dot(self.values, self.probs))
+
+    @property
+    def stdev(self):
+        deviation = self.values - self.mean
+        return float(numpy.sqrt(numpy.dot(deviation * deviation, self.probs)))
+
+    def percentile(self, p):
+        '''
+        The smallest outcome with at least p percent of outcomes at or below it
+        '''
+        cumulative = numpy.cumsum(self.probs)
+        i = numpy.searchsorted(cumulative, p / 100 - 1e-12)
+        return self.values[min(i, len(self.values) - 1)].item()
+
+    def at_least(self, target):
+        return float(1 - self.cdf(target, strict=True))
+
+
+def convolve(a, b):
+    '''
+    The probabilities of the sum of two independent dense distributions
+    Every possible sum keeps a probability of at least the smallest float,
+    so the extremes of big pools are not lost to underflow or rounding
+    '''
+    if len(a) * len(b) <= FFT_SIZE:
+        possible = numpy.convolve(a > 0, b > 0) > 0
+        out = numpy.convolve(a, b)
+    else:
+        n = len(a) + len(b) - 1
+        size = 1 << (n - 1).bit_length()
+
+        def fft_convolve(a, b):
+            return numpy.fft.irfft(numpy.fft.rfft(a, size) * numpy.fft.rfft(b, size), size)[:n]
+
+        # which sums are possible is a convolution of whole numbers, so the noise rounds away
+        possible = fft_convolve(a > 0, b > 0) > 0.5
+        out = fft_convolve(a, b)
+    return numpy.where(possible, numpy.maximum(out, TINY), 0)
+
+
+def faces(sides):
+    if sides > 0:
+        return numpy.arange(1, sides + 1)
+    elif sides < 0:
+        return numpy.arange(sides, 0)
+    return numpy.zeros(1, dtype=numpy.int64)
+
+
+def dice(count, sides, advantage=0, reroll=None):
+    '''
+    The distribution of rolling count dice with the given sides and adding them
+    With advantage a single d20 is rolled twice keeping the higher, the lower with disadvantage
+    Dice of reroll or less are rolled again once
+    '''
+    # big pools can take megabytes each, so only the small common ones are kept
+    if count * abs(sides) <= CACHED_POOL:
+        return cached_dice(count, sides, advantage, reroll)
+    return make_dice(count, sides, advantage, reroll)
+
+
+def make_dice(count, sides, advantage=0, reroll=None):
+    die = faces(sides)
+    single = Distribution.uniform(die)
+    if reroll is not None:
+        low = die <= reroll
+        probs = numpy.where(low, 0, 1) / len(die) + low.mean() / len(die)
+        single = Distribution(die, probs)
+    elif count == 1 and sides == 20 and advantage:
+        return single.maximum(single) if advantage > 0 else single.minimum(single)
+    return single.repeat(count)
+
+
+cached_dice = lru_cache(maxsize=256)(make_dice)
+
+
+def roll(count, sides, advantage=0, reroll=None):
+    '''
+    The distribution of a dice operator whose count and sides are themselves random
+    '''
+    if not (count.integral and sides.integral):
+        raise DistributionError('Dice must have a whole number of sides and be rolled a whole number of times')
+    if len(count.values) * len(sides.values) > MAX_POOLS:
+        raise DistributionError('Too many possible dice pools to compute exactly')
+    values = []
+    probs = []
+    for n, p in zip(count.values.tolist(), count.probs.tolist()):
+        for s, q in zip(sides.values.tolist(), sides.probs.tolist()):
+            pool = dice(max(n, 0), s, advantage, reroll)
+            values.append(pool.values)
+            probs.append(pool.probs * (p * q))
+    return Distribution(numpy.concatenate(values), numpy.concatenate(probs))
@@ -5,6 +5,8 @@ from sqlalchemy import (
     String,
     Integer,
     BigInteger,
+    DateTime,
+    LargeBinary,
 )
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -74,6 +76,31 @@ class Character (Base):
         return f"{self.server} {self.user}"
 
 
+class Snapshot (Base):
+    '''
+    The last known derived data of each character
+    Lets the bot answer commands right after a restart
+    '''
+    __tablename__ = 'snapshots'
+
+    character = Column(
+        Integer,
+        primary_key=True,
+        doc='The id of the character on D&D Beyond')
+    data = Column(
+        LargeBinary,
+        nullable=False,
+        doc='The compressed CharacterSnapshot')
+    fetched = Column(
+        DateTime,
+        nullable=False,
+        doc='When the character was last fetched from D&D Beyond (UTC)')
+    hash = Column(
+        String(64),
+        nullable=False,
+        doc='SHA-256 of the compressed data')
+
+
 class Blacklist (Base):
     '''
     A list of user ids that are not allowed to use the dice bot
@@ -0,0 +1,87 @@
+import time
+import random
+import asyncio
+
+from . import beyondapi as api
+from . import model as m
+from . import util
+
+ACTIVE_WINDOW = 30 * 60  # seconds a user counts as active after their last message
+INTERVAL = 60  # seconds between prefetch passes
+BUDGET = 20  # most characters refreshed per pass
+
+
+def claimed(session, users):
+    '''
+    Gets (server, user, character) for every claim of the users
+    '''
+    claims = session.query(m.Character).filter(m.Character.user.in_(users)).all()
+    return [(claim.server, claim.user, claim.character) for claim in claims]
+
+
+class Prefetch (util.Cog):
+    '''
+    Keeps the characters of recently active users warm
+    so their roll commands rarely wait on D&D Beyond
+    '''
+    def __init__(self, bot):
+        super().__init__(bot)
+        self.active = {}  # (server, user) -> time of last message
+        self.task = bot.loop.create_task(self.run())
+
+    def __unload(self):
+        self.task.cancel()
+
+    async def on_message(self, message):
+        if message.guild is not None and not message.author.bot:
+            self.active[message.guild.id, message.author.id] = time.monotonic()
+
+    async def run(self):
+        await self.bot.wait_until_ready()
+        while not self.bot.is_closed():
+            await asyncio.sleep(INTERVAL)
+            try:
+                await self.prefetch()
+            except Exception as e:
+                print('Prefetch failed:', e)
+
+    async def due(self):
+        '''
+        Gets the claimed characters of active users that will expire before the next pass
+        Soonest to expire first, at most BUDGET of them
+        '''
+        cutoff = time.monotonic() - ACTIVE_WINDOW
+        self.active = {k: v for k, v in self.active.items() if v >= cutoff}
+        if not self.active:
+            return []
+
+        users = {user for _, user in self.active}
+        claims = await self.bot.db.run('prefetch', claimed, users)
+        ids = {character for server, user, character in claims if (server, user) in self.active}
+
+        due = []
+        for id in ids:
+            expires = api.character_cache.expires_in(id)
+            if expires is None or expires < INTERVAL:
+                due.append((expires or 0, id))
+        due.sort()
+        return [id for _, id in due[:BUDGET]]
+
+    async def prefetch(self):
+        due = await self.due()
+        if not due:
+            return
+        # spread the requests over the interval so upstream sees a trickle instead of a burst
+        spacing = INTERVAL / (BUDGET + 1)
+        for id in due:
+            await asyncio.sleep(spacing * random.uniform(0.5, 1.5))
+            try:
+                await api.refresh_character(id)
+            except ValueError:
+                pass
+            else:
+                api.metrics['prefetch'] += 1
+
+
+def setup(bot):
+    bot.add_cog(Prefetch(bot))
@@ -1,125 +1,808 @@
 import re
-import random
-from itertools import chain
-
+import math
+import asyncio
+import operator
+from itertools import chain, product
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
 import discord
 from discord.ext import commands
 import equations
 
 from . import util
+from . import distribution
+
+SUMMARY_THRESHOLD = 50  # dice in one roll before the faces are counted instead of listed
+SUMMARY_FACES = 100  # most sides a summarized roll counts faces for
+CHUNK = 1 << 20  # dice drawn at once from a large pool
+STATS_PERCENTILES = (5, 25, 50, 75, 95)
+
+# cost limits checked before anything is rolled
+MAX_DICE = 10 ** 8  # most dice one expression may roll
+MAX_VALUE = 2 ** 63 - 1  # largest number an expression may reach, dice totals are int64
+MAX_OUTCOMES = distribution.MAX_OUTCOMES  # widest distribution /roll stats will compute
+TRANSCRIPT_BUDGET = 1800  # characters of dice listing shown before the listing is left out
+WORKER_DICE = 10 ** 5  # rolls with more dice than this run on the worker thread
+MAX_REPEAT = 100  # most times one command may repeat a roll
+
+# Discord embed limits for transcripts
+DESCRIPTION_LIMIT = 2048
+FIELD_LIMIT = 1024
+MAX_LINES = 100  # lines a transcript keeps
+
+# N x expression [kh K | kl K]
+REPEAT = re.compile(r'(\d+)\s*[x×]\s*(.+?)(?:\s+k([hl])\s*(\d+))?', re.IGNORECASE | re.DOTALL)
+
+rng = numpy.random.default_rng()  # Generator methods hold the bit generator's lock, so the worker can share it
+# one thread so expensive rolls queue behind each other instead of taking every core
+worker = ThreadPoolExecutor(max_workers=1)
 
 
-def do_roll(expression, advantage=None, output=[]):
+def draw(count, sides):
     '''
-    Rolls dice
+    Rolls count dice with the given number of sides as an array
+    Negative sides roll from sides to -1, zero sides always roll 0
     '''
-    expression = expression.strip()
-    if advantage is None:
-        advantage = 0
+    if sides > 0:
+        return rng.integers(1, sides, size=count, endpoint=True)
+    elif sides < 0:
+        return rng.integers(sides, -1, size=count, endpoint=True)
+    else:
+        return numpy.zeros(count, dtype=numpy.int64)
 
-    original_expression = expression
 
-    # Set up operations
-    def roll_dice(a, b, *, silent=False):
-        rolls = []
-        for _ in range(a):
-            if b > 0:
-                n = random.randint(1, b)
-            elif b < 0:
-                n = random.randint(b, -1)
-            else:
-                n = 0
-            rolls.append(n)
-        value = sum(rolls)
-        if not silent:
-            output.append('{}d{}: {} = {}'.format(a, b, ' + '.join(map(str, rolls)), value))
+def pool_size(a, b):
+    '''
+    Validates the operands of a dice operator, returns (count, sides)
+    '''
+    count = max(operator.index(a), 0)
+    if b % 1:
+        raise ValueError('Dice must have a whole number of sides')
+    return count, int(b)
+
+
+def roll_pool(count, sides, low=None, summarize=True):
+    '''
+    Rolls a pool too large to list die by die, drawing CHUNK dice at a time
+    Dice of low or less are rolled again once
+    Returns (total, summary of the faces rolled), the summary is None if not summarized
+    '''
+    first = 1 if sides > 0 else sides
+    width = abs(sides) or 1
+    tally = numpy.zeros(width, dtype=numpy.int64) if summarize and width <= SUMMARY_FACES else None
+    lowest = highest = None
+    total = 0
+    rerolled = 0
+    for start in range(0, count, CHUNK):
+        rolls = draw(min(CHUNK, count - start), sides)
+        if low is not None:
+            mask = rolls <= low
+            n = int(mask.sum())
+            rerolled += n
+            rolls[mask] = draw(n, sides)
+        total += int(rolls.sum())
+        if not summarize:
+            continue
+        if tally is not None:
+            tally += numpy.bincount(rolls - first, minlength=width)
+        else:
+            lowest = int(rolls.min()) if lowest is None else min(lowest, int(rolls.min()))
+            highest = int(rolls.max()) if highest is None else max(highest, int(rolls.max()))
+
+    if not summarize:
+        return total, None
+    if tally is not None:
+        summary = ', '.join('{}×{}'.format(n, face) for face, n in enumerate(tally.tolist(), first) if n)
+    else:
+        summary = 'lowest {}, highest {}'.format(lowest, highest)
+    if low is not None:
+        summary = '{} rerolled, {}'.format(rerolled, summary)
+    return total, summary
+
+
+class Faces:
+    '''
+    Dice rolled, joined with + only when shown
+    '''
+    __slots__ = ('rolls',)
+
+    def __init__(self, rolls):
+        self.rolls = rolls
+
+    def __format__(self, spec):
+        return ' + '.join(map(str, self.rolls.tolist()))
+
+
+class Transcript:
+    '''
+    The lines explaining a roll, formatted only when rendered
+    Past max_lines each new line replaces the last one kept,
+    so the result of a roll is always shown
+    '''
+    __slots__ = ('lines', 'dropped', 'max_lines')
+    recording = True
+
+    def __init__(self, max_lines=MAX_LINES):
+        self.lines = []
+        self.dropped = 0
+        self.max_lines = max_lines
+
+    def add(self, template, *args):
+        '''
+        Adds the line template.format(*args)
+        '''
+        if len(self.lines) < self.max_lines:
+            self.lines.append((template, args))
+        else:
+            self.lines[-1] = (template, args)
+            self.dropped += 1
+
+    def render(self, limit=DESCRIPTION_LIMIT):
+        '''
+        Formats the transcript in at most limit characters
+        Lines are left out from the end of the middle until it fits, the first and last are kept
+        '''
+        lines = [template.format(*args) for template, args in self.lines]
+        omitted = self.dropped
+
+        def note():
+            return '… {} more line{}'.format(omitted, '' if omitted == 1 else 's')
+
+        def size():
+            extra = len(note()) + 1 if omitted else 0
+            return sum(map(len, lines)) + len(lines) - 1 + extra
+
+        while len(lines) > 2 and size() > limit:
+            del lines[-2]
+            omitted += 1
+        if omitted:
+            lines.insert(len(lines) - 1, note())
+        if len(lines) > 1 and size() > limit:
+            # a long expression is shortened before the result is lost
+            room = max(limit - (size() - len(lines[0])), 1)
+            lines[0] = lines[0][:room - 1] + '…'
+        text = '\n'.join(lines)
+        if len(text) > limit:
+            text = text[:limit - 1] + '…'
+        return text
+
+
+class NullTranscript (Transcript):
+    '''
+    A transcript for when only the result of a roll is wanted, nothing is formatted or kept
+    '''
+    __slots__ = ()
+    recording = False
+
+    def add(self, template, *args):
+        pass
+
+    def render(self, limit=DESCRIPTION_LIMIT):
+        return ''
+
+
+NO_OUTPUT = NullTranscript()
+
+
+def roll_dice(a, b, output):
+    count, sides = pool_size(a, b)
+    if count > SUMMARY_THRESHOLD:
+        value, summary = roll_pool(count, sides, summarize=output.recording)
+        output.add('{}d{}: {} = {}', a, b, summary, value)
         return value
 
-    def great_weapon_fighting(a, b, low=2, *, silent=False):
-        rolls = []
-        rerolls = []
-        value = 0
-        for _ in range(a):
-            n = roll_dice(1, b, silent=True)
-            rolls.append(n)
-            if n <= low:
-                n2 = random.randint(1, b)
-                rerolls.append(n2)
-                value += n2
-            else:
-                value += n
-        if not silent:
-            rolled = ' + '.join(map(str, rolls))
-            if rerolls:
-                rerolled = list(filter(lambda a: a > low, rolls))
-                rerolled.extend(rerolls)
-                rerolled = ' + '.join(map(str, rerolled))
-                output.append('{}g{}: {}, rerolled: {} = {}'.format(a, b, rolled, rerolled, value))
-            else:
-                output.append('{}g{}: {} = {}'.format(a, b, rolled, value))
+    rolls = draw(count, sides)
+    value = int(rolls.sum())
+    output.add('{}d{}: {} = {}', a, b, Faces(rolls), value)
+    return value
+
+
+def great_weapon_fighting(a, b, output, low=2):
+    count, sides = pool_size(a, b)
+    if count > SUMMARY_THRESHOLD:
+        value, summary = roll_pool(count, sides, low, summarize=output.recording)
+        output.add('{}g{}: {} = {}', a, b, summary, value)
         return value
 
-    def roll_advantage(a, b, *, silent=False):
-        if a == 1 and b == 20:
-            first = roll_dice(a, b, silent=True)
-            second = roll_dice(a, b, silent=True)
-            out = max(first, second)
-            if not silent:
-                output.append('{}d{}: max({}, {}) = {}'.format(a, b, first, second, out))
-        else:
-            out = roll_dice(a, b, silent=silent)
-        return out
-
-    def roll_disadvantage(a, b, *, silent=False):
-        if a == 1 and b == 20:
-            first = roll_dice(a, b, silent=True)
-            second = roll_dice(a, b, silent=True)
-            out = min(first, second)
-            if not silent:
-                output.append('{}d{}: min({}, {}) = {}'.format(a, b, first, second, out))
+    rolls = draw(count, sides)
+    mask = rolls <= low
+    rerolls = draw(int(mask.sum()), sides)
+    value = int(rolls[~mask].sum()) + int(rerolls.sum())
+    if len(rerolls):
+        rerolled = numpy.concatenate([rolls[~mask], rerolls])
+        output.add('{}g{}: {}, rerolled: {} = {}', a, b, Faces(rolls), Faces(rerolled), value)
+    else:
+        output.add('{}g{}: {} = {}', a, b, Faces(rolls), value)
+    return value
+
+
+def roll_advantage(a, b, output):
+    if a == 1 and b == 20:
+        first = roll_dice(a, b, NO_OUTPUT)
+        second = roll_dice(a, b, NO_OUTPUT)
+        out = max(first, second)
+        output.add('{}d{}: max({}, {}) = {}', a, b, first, second, out)
+    else:
+        out = roll_dice(a, b, output)
+    return out
+
+
+def roll_disadvantage(a, b, output):
+    if a == 1 and b == 20:
+        first = roll_dice(a, b, NO_OUTPUT)
+        second = roll_dice(a, b, NO_OUTPUT)
+        out = min(first, second)
+        output.add('{}d{}: min({}, {}) = {}', a, b, first, second, out)
+    else:
+        out = roll_dice(a, b, output)
+    return out
+
+
+# operator tables in precedence order, lowest first, built once
+operations = equations.operations + [
+    {'>': max, '<': min},
+    {'d': roll_dice, 'D': roll_dice, 'g': great_weapon_fighting, 'G': great_weapon_fighting},
+]
+DICE = len(operations) - 1
+unary = dict(equations.unary)
+unary['!'] = lambda a: a // 2 - 5
+operators = set(chain(*operations)) | set(unary)
+
+# the d operator for each advantage
+dice = {
+    0: roll_dice,
+    1: roll_advantage,
+    -1: roll_disadvantage,
+}
+
+# numpy versions of the binary operations that do not work on arrays
+array_operations = {
+    max: numpy.maximum,
+    min: numpy.minimum,
+}
+
+# kinds of instruction in a compiled roll
+NUMBER, UNARY, BINARY, ROLL = range(4)
+
+
+def sample_dice(count, sides, trials, advantage=0, reroll=None):
+    '''
+    Rolls count dice with the given sides in each of trials at once, returns an array of the totals
+    count and sides may be numbers or arrays with a value for each trial
+    '''
+    if numpy.any(numpy.mod(count, 1)):
+        raise ValueError('Dice must be rolled a whole number of times')
+    if numpy.any(numpy.mod(sides, 1)):
+        raise ValueError('Dice must have a whole number of sides')
+    count = numpy.maximum(count, 0).astype(numpy.int64)
+    sides = numpy.asarray(sides).astype(numpy.int64)
+    width = int(count.max()) if count.size else 0
+
+    if sides.ndim == 0:
+        rolls = draw((trials, width), int(sides))
+        if reroll is not None:
+            mask = rolls <= reroll
+            rolls[mask] = draw(int(mask.sum()), int(sides))
+    else:
+        # a range of faces for each trial, zero sided dice roll 0 to 0
+        low = numpy.where(sides > 0, 1, sides)[:, None]
+        high = numpy.where(sides > 0, sides, numpy.where(sides < 0, -1, 0))[:, None]
+        rolls = rng.integers(low, high, size=(trials, width), endpoint=True)
+        if reroll is not None:
+            rolls = numpy.where(rolls <= reroll, rng.integers(low, high, size=(trials, width), endpoint=True), rolls)
+    if count.ndim:
+        rolls[numpy.arange(width) >= count[:, None]] = 0
+    totals = rolls.sum(axis=1)
+
+    if advantage and reroll is None:
+        single = (count == 1) & (sides == 20)
+        if numpy.any(single):
+            second = draw(trials, 20)
+            best = numpy.maximum(totals, second) if advantage > 0 else numpy.minimum(totals, second)
+            totals = numpy.where(single, best, totals)
+    return totals
+
+
+def sample_binary(func, a, b):
+    '''
+    Applies a binary operation to arrays of results
+    '''
+    if func in (operator.truediv, operator.floordiv, operator.mod) and numpy.any(numpy.equal(b, 0)):
+        raise ZeroDivisionError('division by zero')
+    if func is operator.pow and numpy.any(numpy.less(b, 0)):
+        a = numpy.asarray(a, dtype=numpy.float64)
+    return array_operations.get(func, func)(a, b)
+
+
+class Cost:
+    '''
+    Upper bounds on the work evaluating a compiled roll can do
+    dice: dice drawn, including rerolls
+    value: magnitude of the largest number reached
+    transcript: characters of dice listing
+    outcomes: possible totals summed by /roll stats
+    '''
+    __slots__ = ('dice', 'value', 'transcript', 'outcomes')
+
+    def __init__(self):
+        self.dice = 0
+        self.value = 0
+        self.transcript = 0
+        self.outcomes = 0
+
+
+def candidates(interval):
+    '''
+    The points of an interval where operations reach their extremes
+    '''
+    low, high = interval
+    return {low, high} | {x for x in (-1, 0, 1) if low <= x <= high}
+
+
+def apply(func, *args):
+    '''
+    Calls func, returning None where it is undefined and inf where it overflows
+    '''
+    try:
+        if func is operator.pow:
+            a, b = args
+            if abs(a) > 1 and b * math.log2(abs(a)) > 64:
+                return math.inf
+        result = func(*args)
+    except (ZeroDivisionError, ValueError, TypeError):
+        return None
+    except OverflowError:
+        return math.inf
+    if isinstance(result, complex):
+        return None
+    return result
+
+
+def interval(results):
+    results = [r for r in results if r is not None]
+    if not results:
+        return (0, 0)
+    return (min(results), max(results))
+
+
+def integral(interval):
+    '''
+    Whether every value in the interval is a whole number, as far as the types of its ends tell
+    '''
+    return all(isinstance(x, int) for x in interval)
+
+
+def binary_interval(func, a, b):
+    '''
+    The interval the result of a binary operation on values in intervals a and b lies in
+    Operations that are not monotonic in each operand are bounded directly instead of at the candidate points
+    '''
+    if func is operator.mod:
+        return mod_interval(a, b)
+    if func in (operator.truediv, operator.floordiv) and b[0] <= 0 <= b[1] and not integral(b):
+        # a fractional divisor can come arbitrarily close to zero between the candidate points
+        return (-math.inf, math.inf)
+    if func is operator.pow:
+        return pow_interval(a, b)
+    return interval(apply(func, x, y) for x, y in product(candidates(a), candidates(b)))
+
+
+def mod_interval(a, b):
+    '''
+    The remainder has the sign of the divisor and is smaller than it,
+    and a dividend already smaller than a divisor of its sign is left as it is
+    '''
+    m = max(abs(b[0]), abs(b[1]))
+    if integral(a) and integral(b):
+        m = max(m - 1, 0)
+    low = -m if b[0] < 0 else 0
+    high = m if b[1] > 0 else 0
+    if a[0] >= 0 and b[0] > 0:
+        high = min(high, a[1])
+    if a[1] <= 0 and b[1] < 0:
+        low = max(low, a[0])
+    return (low, high)
+
+
+def pow_interval(a, b):
+    '''
+    The interval of a to the power of b
+    A negative base alternates sign with the exponent, so only the magnitude is bounded
+    '''
+    if b[0] < 0 and a[0] <= 0 <= a[1] and not integral(a):
+        # a fractional base can come arbitrarily close to zero between the candidate points
+        return (-math.inf, math.inf)
+    if a[0] >= 0:
+        # monotonic in each operand
+        low, high = interval(apply(operator.pow, x, y) for x, y in product(candidates(a), candidates(b)))
+    else:
+        magnitude = (0 if a[1] >= 0 else -a[1], max(-a[0], a[1]))
+        high = max(map(abs, interval(
+            apply(operator.pow, x, y) for x, y in product(candidates(magnitude), candidates(b)))))
+        low = -high
+    if not (integral(a) and integral(b) and b[0] >= 0):
+        # negative powers are fractions even where the ends are not
+        low, high = float(low), float(high)
+    return (low, high)
+
+
+def faces_interval(sides):
+    '''
+    The lowest and highest faces of any die with sides in the interval
+    '''
+    low, high = sides
+    lowest = low if low < 0 else min(low, 1)
+    highest = high if high > 0 else max(high, -1)
+    return lowest, highest
+
+
+def estimate(program):
+    '''
+    Bounds the cost of a compiled program by tracking the interval every value lies in
+    '''
+    cost = Cost()
+    stack = []
+    for kind, value in program:
+        if kind == NUMBER:
+            stack.append((value, value))
+        elif kind == UNARY:
+            stack.append(interval(apply(value, x) for x in candidates(stack.pop())))
         else:
-            out = roll_dice(a, b, silent=silent)
-        return out
+            b = stack.pop()
+            a = stack.pop()
+            if kind == BINARY:
+                stack.append(binary_interval(value, a, b))
+            else:
+                count = max(a[1], 0)
+                if not math.isfinite(count) or not all(map(math.isfinite, b)):
+                    cost.value = math.inf
+                    return cost
+                count = int(count)
+                low, high = faces_interval(b)
+                stack.append((min(count * low, 0), max(count * high, 0)))
+                width = int(max(abs(b[0]), abs(b[1]))) or 1
+                cost.dice += count * (2 if value == 'g' else 1)
+                cost.outcomes += count * width
+                if count > SUMMARY_THRESHOLD:
+                    # face counts, or the lowest and highest rolls
+                    cost.transcript += min(width, SUMMARY_FACES) * (len(str(count)) + len(str(width)) + 3) + 40
+                else:
+                    cost.transcript += count * (len(str(width)) + 4) * (2 if value == 'g' else 1) + 20
+        cost.value = max(cost.value, *map(abs, stack[-1]))
+    return cost
+
+
+class CompiledRoll:
+    '''
+    A dice expression parsed and validated once
+    Evaluating it rolls fresh dice every time
+    '''
+    __slots__ = ('expression', 'program', 'error', 'cost')
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.program = None
+        self.error = None
+        self.cost = None
+
+        for token in re.findall(r'[a-zA-Z]+', expression):
+            if token not in operators:
+                self.error = token
+                return
+
+        try:
+            postfix = equations.infix2postfix(expression, operations=operations, unary=unary)
+        except equations.EquationError as e:
+            self.error = e
+            return
+
+        program = []
+        depth = 0
+        for type, token in postfix:
+            if type == 'INT':
+                program.append((NUMBER, int(token)))
+                depth += 1
+            elif type == 'FLOAT':
+                program.append((NUMBER, float(token)))
+                depth += 1
+            elif type == 'UNARY':
+                if depth < 1:
+                    self.error = equations.NotEnoughOperands(expression, token, unary=True)
+                    return
+                program.append((UNARY, unary[token]))
+            else:
+                if depth < 2:
+                    self.error = equations.NotEnoughOperands(expression, token)
+                    return
+                depth -= 1
+                if type == DICE:
+                    program.append((ROLL, token.lower()))
+                else:
+                    program.append((BINARY, operations[type][token]))
+        if depth != 1:
+            self.error = equations.TooManyOperands(expression)
+            return
+        self.program = tuple(program)
+
+        self.cost = estimate(self.program)
+        if self.cost.value > MAX_VALUE:
+            self.error = ValueError('The numbers in this roll get too large')
+        elif self.cost.dice > MAX_DICE:
+            self.error = ValueError('Too many dice, at most {:,} can be rolled at once'.format(MAX_DICE))
+
+    def expensive(self, count=1):
+        '''
+        Whether rolling this count times should be kept off the event loop
+        '''
+        return self.cost is not None and self.cost.dice * count > WORKER_DICE
+
+    def check(self, output=NO_OUTPUT):
+        '''
+        Raises the error found when compiling, if any
+        '''
+        if isinstance(self.error, str):
+            raise equations.EquationError('\n{}\nCould not find: `{}`'.format(output.render(), self.error))
+        elif self.error is not None:
+            raise self.error.with_traceback(None)
+
+    def evaluate(self, advantage, output=NO_OUTPUT):
+        self.check(output)
+        roll_d = dice[(advantage > 0) - (advantage < 0)]
+        stack = []
+        for kind, value in self.program:
+            if kind == NUMBER:
+                stack.append(value)
+            elif kind == UNARY:
+                stack.append(value(stack.pop()))
+            else:
+                b = stack.pop()
+                a = stack.pop()
+                if kind == BINARY:
+                    stack.append(value(a, b))
+                elif value == 'd':
+                    stack.append(roll_d(a, b, output))
+                else:
+                    stack.append(great_weapon_fighting(a, b, output))
+        return stack[0]
+
+    def sample(self, trials, advantage=0, crit=None):
+        '''
+        Evaluates the roll for many trials at once, returns an array of the results
+        Dice are doubled in the trials where crit is true
+        '''
+        self.check()
+        dice = self.cost.dice * (1 if crit is None else 2)
+        if dice * trials > MAX_DICE:
+            raise ValueError('Too many dice, at most {:,} can be rolled at once'.format(MAX_DICE))
+        # batches of trials keep each array of dice near CHUNK long
+        batch = max(CHUNK // max(dice, 1), 1)
+        results = []
+        for start in range(0, trials, batch):
+            n = min(batch, trials - start)
+            results.append(self.sample_batch(n, advantage, None if crit is None else crit[start:start + n]))
+        return numpy.concatenate(results) if results else numpy.zeros(0)
+
+    def sample_batch(self, trials, advantage, crit):
+        stack = []
+        for kind, value in self.program:
+            if kind == NUMBER:
+                stack.append(value)
+            elif kind == UNARY:
+                stack.append(value(stack.pop()))
+            else:
+                b = stack.pop()
+                a = stack.pop()
+                if kind == BINARY:
+                    stack.append(sample_binary(value, a, b))
+                    continue
+                if crit is not None:
+                    a = numpy.where(crit, numpy.multiply(a, 2), a)
+                if value == 'd':
+                    stack.append(sample_dice(a, b, trials, advantage))
+                else:
+                    stack.append(sample_dice(a, b, trials, reroll=2))
+        return numpy.broadcast_to(stack[0], trials)
+
+    def distribution(self, advantage=0):
+        '''
+        Gets the exact distribution of every possible result
+        '''
+        self.check()
+        if self.cost.outcomes > MAX_OUTCOMES:
+            raise distribution.DistributionError('Too many possible outcomes to compute exactly')
+        advantage = (advantage > 0) - (advantage < 0)
+        stack = []
+        for kind, value in self.program:
+            if kind == NUMBER:
+                stack.append(distribution.Distribution.constant(value))
+            elif kind == UNARY:
+                stack.append(stack.pop().map(value))
+            else:
+                b = stack.pop()
+                a = stack.pop()
+                if kind == BINARY:
+                    stack.append(a.combine(b, value))
+                elif value == 'd':
+                    stack.append(distribution.roll(a, b, advantage))
+                else:
+                    stack.append(distribution.roll(a, b, reroll=2))
+        return stack[0]
+
+
+@lru_cache(maxsize=1024)
+def compile_roll(expression):
+    '''
+    Gets the compiled form of an expression, invalid ones included
+    '''
+    return CompiledRoll(expression)
 
-    operations = equations.operations.copy()
-    operations.append({'>': max, '<': min})
 
-    dice = {}
-    if advantage == 0:
-        dice['d'] = roll_dice
-    elif advantage > 0:
-        dice['d'] = roll_advantage
+def do_roll(expression, advantage=None, output=NO_OUTPUT):
+    '''
+    Rolls dice, explaining the roll in output if given
+    The dice are left out if listing them would be too long
+    '''
+    expression = expression.strip()
+    if advantage is None:
+        advantage = 0
+
+    output.add('`{}`', expression)
+
+    compiled = compile_roll(expression)
+    if compiled.cost is not None and compiled.cost.transcript > TRANSCRIPT_BUDGET:
+        roll = compiled.evaluate(advantage)
+        output.add('(too many dice to list)')
     else:
-        dice['d'] = roll_disadvantage
-    dice['D'] = dice['d']
-    dice['g'] = great_weapon_fighting
-    dice['G'] = dice['g']
-    operations.append(dice)
-
-    unary = equations.unary.copy()
-    unary['!'] = lambda a: a // 2 - 5
-
-    output.append('`{}`'.format(expression))
-
-    # validate
-    for token in re.findall(r'[a-zA-Z]+', expression):
-        if token not in chain(*operations) and token not in unary:
-            search = r'[a-zA-Z]*({})[a-zA-Z]*'.format(re.escape(token))
-            search = re.search(search, original_expression)
-            if search:
-                token = search.group(1)
-            raise equations.EquationError('\n{}\nCould not find: `{}`'.format('\n'.join(output), token))
-
-    # do roll
-    roll = equations.solve(expression, operations=operations, unary=unary)
+        roll = compiled.evaluate(advantage, output)
     if roll % 1 == 0:
         roll = int(roll)
 
-    output.append('You rolled {}'.format(roll))
+    output.add('You rolled {}', roll)
 
     return roll
 
 
+def parse_repeat(text):
+    '''
+    Splits "N x text", optionally followed by "kh K" or "kl K", into (text, N, keep)
+    keep is K to keep the highest K results, -K for the lowest, None for all of them
+    Text without a repeat is rolled once
+    '''
+    match = REPEAT.fullmatch(text.strip())
+    if match is None:
+        return text, 1, None
+    count, text, which, keep = match.groups()
+    count = int(count)
+    if not 1 <= count <= MAX_REPEAT:
+        raise ValueError('Rolls can be repeated 1 to {} times'.format(MAX_REPEAT))
+    if keep is not None:
+        keep = int(keep)
+        if not 1 <= keep <= count:
+            raise ValueError('Can only keep 1 to {} of the rolls'.format(count))
+        if which.lower() == 'l':
+            keep = -keep
+    return text, count, keep
+
+
+def repeat_roll(expression, count, advantage=None):
+    '''
+    Rolls an expression count times without listing the dice, returns the results
+    '''
+    compiled = compile_roll(expression.strip())
+    compiled.check()
+    if compiled.cost.dice * count > MAX_DICE:
+        raise ValueError('Too many dice, at most {:,} can be rolled at once'.format(MAX_DICE))
+    results = []
+    for _ in range(count):
+        roll = compiled.evaluate(advantage or 0)
+        if roll % 1 == 0:
+            roll = int(roll)
+        results.append(roll)
+    return results
+
+
+def kept(results, keep):
+    '''
+    Gets the indices of the results kept
+    '''
+    if keep is None:
+        return set(range(len(results)))
+    order = sorted(range(len(results)), key=results.__getitem__, reverse=keep > 0)
+    return set(order[:abs(keep)])
+
+
+def format_results(results, keep, limit=FIELD_LIMIT):
+    '''
+    Lists results on one line in at most limit characters, striking out the ones not kept
+    '''
+    text = format(Results(results, keep))
+    if len(text) > limit:
+        text = text[:limit - 1] + '…'
+    return text
+
+
+class Results:
+    '''
+    Results on one line with the ones not kept struck out, joined only when shown
+    '''
+    __slots__ = ('results', 'keep')
+
+    def __init__(self, results, keep):
+        self.results = results
+        self.keep = keep
+
+    def __format__(self, spec):
+        return ', '.join(str(r) if i in self.keep else '~~{}~~'.format(r) for i, r in enumerate(self.results))
+
+
+def do_repeat(expression, count, keep=None, advantage=None, output=NO_OUTPUT):
+    '''
+    Rolls dice count times, returns the total of the results kept
+    '''
+    expression = expression.strip()
+    results = repeat_roll(expression, count, advantage)
+    keep_indices = kept(results, keep)
+    total = sum(results[i] for i in keep_indices)
+
+    output.add('`{}` × {}', expression, count)
+    output.add('{}', Results(results, keep_indices))
+    if keep is None:
+        output.add('Total {}', total)
+    else:
+        output.add('Total of the {} {}: {}', 'highest' if keep > 0 else 'lowest', abs(keep), total)
+
+    return total
+
+
+async def do_roll_async(expression, advantage=None, output=NO_OUTPUT, count=1, keep=None, *, loop=None):
+    '''
+    Rolls dice, count times if count is more than 1
+    Expensive rolls are done on the worker thread
+    '''
+    if count == 1:
+        func = partial(do_roll, expression, advantage, output)
+    else:
+        func = partial(do_repeat, expression, count, keep, advantage, output)
+    return await run_roll(expression, count, func, loop)
+
+
+async def repeat_roll_async(expression, count, advantage=None, *, loop=None):
+    '''
+    Rolls an expression count times without listing the dice, returns the results
+    Expensive rolls are done on the worker thread
+    '''
+    return await run_roll(expression, count, partial(repeat_roll, expression, count, advantage), loop)
+
+
+async def run_roll(expression, count, func, loop=None):
+    '''
+    Calls func, on the worker thread if rolling the expression count times is expensive
+    '''
+    if not compile_roll(expression.strip()).expensive(count):
+        return func()
+    loop = loop or asyncio.get_event_loop()
+    return await loop.run_in_executor(worker, func)
+
+
+def roll_stats(expression, advantage=0, target=None):
+    '''
+    Describes the distribution of a dice expression
+    '''
+    expression = expression.strip()
+    dist = compile_roll(expression).distribution(advantage)
+
+    output = ['`{}`'.format(expression)]
+    output.append('Mean: {:.2f}, standard deviation: {:.2f}'.format(dist.mean, dist.stdev))
+    output.append('Range: {} to {}'.format(dist.values[0].item(), dist.values[-1].item()))
+    output.append('Percentiles: ' + ', '.join(
+        '{}%: {}'.format(p, dist.percentile(p)) for p in STATS_PERCENTILES))
+    if target is not None:
+        output.append('Chance of {} or more: {:.2%}'.format(target, dist.at_least(target)))
+    return output
+
+
 class RollCategory (util.Cog):
     @commands.group('roll', aliases=['r'], invoke_without_command=True)
     async def group(self, ctx, *, expression: str):
@@ -150,6 +833,10 @@ class RollCategory (util.Cog):
         - : negates a number
         + : does nothing to a number
         ! : gets the modifier of an ability score using standard D&D modifier rules (score/2-5) i.e. !16 = 3
+
+        Repeating:
+        N x expression rolls the expression N times, i.e. 6 x 4d6
+        add kh K or kl K to total only the highest or lowest K results, i.e. 2 x 1d20 kh 1
         '''
         if not expression:
             raise commands.MissingRequiredArgument('expression')
@@ -158,9 +845,11 @@ class RollCategory (util.Cog):
         if not hasattr(ctx, 'advantage'):
             ctx.advantage = 0
 
-        output = []
-        do_roll(expression, advantage=ctx.advantage, output=output)
-        embed = discord.Embed(description='\n'.join(output))
+        expression, count, keep = parse_repeat(expression)
+        output = Transcript()
+        await do_roll_async(expression, advantage=ctx.advantage, output=output, count=count, keep=keep,
+                            loop=ctx.bot.loop)
+        embed = discord.Embed(description=output.render(DESCRIPTION_LIMIT))
         await ctx.send(embed=embed)
 
     @group.command(aliases=['adv'])
@@ -173,6 +862,39 @@ class RollCategory (util.Cog):
         ctx.advantage = -1
         await ctx.invoke(self.group, expression=expression)
 
+    @group.command()
+    async def stats(self, ctx, *, expression: str):
+        '''
+        Shows the odds of every result of a roll without rolling
+
+        Parameters:
+        [expression*] the dice expression, optionally starting with adv or dis
+            and ending with >= N to get the chance of rolling at least N
+        '''
+        expression = util.strip_quotes(expression)
+        advantage = 0
+        first, _, rest = expression.partition(' ')
+        if first.lower() in ('adv', 'advantage', 'dis', 'disadv', 'disadvantage'):
+            advantage = 1 if first.lower().startswith('adv') else -1
+            expression = rest
+        target = None
+        if '>=' in expression:
+            expression, target = expression.rsplit('>=', 1)
+            try:
+                target = float(target)
+            except ValueError:
+                raise commands.BadArgument('The target after >= must be a number')
+            if target % 1 == 0:
+                target = int(target)
+        if not expression.strip():
+            raise commands.MissingRequiredArgument('expression')
+
+        # pairwise operations and random dice pools can take seconds even when the result is narrow,
+        # so every distribution is computed on the worker
+        output = await ctx.bot.loop.run_in_executor(worker, roll_stats, expression, advantage, target)
+        embed = discord.Embed(description='\n'.join(output))
+        await ctx.send(embed=embed)
+
 
 def setup(bot):
     bot.add_cog(RollCategory(bot))
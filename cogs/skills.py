@@ -8,12 +8,12 @@ from . import rolls
 class SkillCategory (util.Cog):
     @commands.group('skill', aliases=['s'], invoke_without_command=True)
     async def group(self, ctx, *, name: str):
-        name = util.strip_quotes(name)
+        name, count, keep = rolls.parse_repeat(util.strip_quotes(name))
 
         if not hasattr(ctx, 'advantage'):
             ctx.advantage = 0
 
-        character = util.get_character(ctx, ctx.author.id)
+        character = await util.get_character(ctx, ctx.author.id)
         skill = character.skills.get(name.lower())
         if skill is None:
             raise ValueError('No skill with that name')
@@ -25,9 +25,9 @@ class SkillCategory (util.Cog):
 
         embed = discord.Embed(color=character.color())
         embed.set_author(**character.embed_author())
-        text = []
-        rolls.do_roll(f"1d20+{skill}", advantage=ctx.advantage, output=text)
-        embed.add_field(name=name, value='\n'.join(text), inline=False)
+        text = rolls.Transcript()
+        await rolls.do_roll_async(f"1d20+{skill}", advantage=ctx.advantage, output=text, count=count, keep=keep)
+        embed.add_field(name=name, value=text.render(rolls.FIELD_LIMIT), inline=False)
         await ctx.send(embed=embed)
 
     @group.command(aliases=['a', 'adv'])
@@ -42,7 +42,7 @@ class SkillCategory (util.Cog):
 
     @group.command(ignore_extra=False)
     async def list(self, ctx):
-        character = util.get_character(ctx, ctx.author.id)
+        character = await util.get_character(ctx, ctx.author.id)
         skills = map("**{0[0]}:** {0[1]:+d}".format, character.skills.items())
         embed = discord.Embed(title='Skills', description='\n'.join(skills), color=character.color())
         embed.set_author(**character.embed_author())
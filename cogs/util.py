@@ -1,3 +1,6 @@
+import hashlib
+from datetime import datetime
+
 from discord.ext import commands
 
 from . import beyondapi as api
@@ -15,18 +18,67 @@ class Cog:
         self.bot = bot
 
 
-def get_character(id, user=None):
+def load_snapshot(session, id):
+    item = session.query(m.Snapshot).get(id)
+    if item is None:
+        return None
+    return item.data, item.fetched
+
+
+def save_snapshot(session, id, data, hash):
+    item = session.query(m.Snapshot).get(id)
+    if item is None:
+        item = m.Snapshot(character=id)
+        session.add(item)
+    if item.hash != hash:
+        item.data = data
+        item.hash = hash
+    item.fetched = datetime.utcnow()
+    session.commit()
+
+
+def touch_snapshot(session, id):
+    session.query(m.Snapshot).filter_by(character=id).update({'fetched': datetime.utcnow()})
+    session.commit()
+
+
+class SnapshotStore:
+    '''
+    Keeps character snapshots in the database so they survive restarts
+    '''
+    def __init__(self, db):
+        self.db = db
+
+    async def load(self, id):
+        return await self.db.run('snapshot load', load_snapshot, id)
+
+    async def save(self, id, data):
+        hash = hashlib.sha256(data).hexdigest()
+        await self.db.run('snapshot save', save_snapshot, id, data, hash)
+
+    async def touch(self, id):
+        await self.db.run('snapshot touch', touch_snapshot, id)
+
+
+def get_claim(session, server, user):
+    '''
+    Gets the id of the character a user claimed in a server, or None
+    '''
+    claim = session.query(m.Character).get((server, user))
+    return None if claim is None else claim.character
+
+
+async def get_character(id, user=None):
     '''
     If only id is given gets the character from the id
     If id and user is given gets the claim from the ctx (passed in as id) and user id
     '''
     if user is not None:
         ctx = id
-        claim = ctx.session.query(m.Character).get((ctx.guild.id, user))
-        if claim is None:
+        id = await ctx.bot.db.run('get_character', get_claim, ctx.guild.id, user)
+        if id is None:
             raise LookupError('User has no character')
-        id = claim.character
-    character = api.Character(id)
+    character = await api.load_character(id)
     return character
 
 